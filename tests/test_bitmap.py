@@ -0,0 +1,91 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'zlogparser'))
+
+from bitmap import ARRAY  # noqa: E402
+from bitmap import ARRAY_MAX  # noqa: E402
+from bitmap import BITSET  # noqa: E402
+from bitmap import CHUNK  # noqa: E402
+from bitmap import RUN  # noqa: E402
+from bitmap import Bitmap  # noqa: E402
+
+
+def kinds(bitmap):
+    return [bitmap.containers[high][0] for high in sorted(bitmap.containers)]
+
+
+def samples():
+    """
+    id sets around the container boundaries, keyed by a description
+    """
+    rng = random.Random(0)
+    evens = list(range(0, 2 * ARRAY_MAX, 2))
+    return {
+        'empty': [],
+        'single': [7],
+        'last of chunk': [CHUNK - 1],
+        'first of next chunk': [CHUNK],
+        'array max': evens,
+        'array max + 1': evens + [2 * ARRAY_MAX],
+        'full chunk': list(range(CHUNK)),
+        'full chunk - 1': list(range(1, CHUNK)),
+        'two full chunks': list(range(CHUNK, 3 * CHUNK)),
+        'runs': [v for start in range(0, CHUNK, 1000) for v in range(start, start + 300)],
+        'random sparse': sorted(rng.sample(range(4 * CHUNK), 3000)),
+        'random dense': sorted(rng.sample(range(2 * CHUNK), 50000)),
+        'across chunks': list(range(CHUNK - 10, CHUNK + 10)) + [5 * CHUNK + 3],
+    }
+
+
+class BitmapTest(unittest.TestCase):
+    def test_container_kinds(self):
+        s = samples()
+        self.assertEqual(kinds(Bitmap.from_sorted(s['array max'])), [ARRAY])
+        self.assertEqual(kinds(Bitmap.from_sorted(s['array max + 1'])), [BITSET])
+        self.assertEqual(kinds(Bitmap.from_sorted(s['full chunk'])), [RUN])
+        self.assertEqual(kinds(Bitmap.from_sorted(s['runs'])), [RUN])
+        self.assertEqual(Bitmap.from_sorted(s['full chunk']).containers[0], (RUN, [(0, CHUNK)]))
+
+    def test_round_trip(self):
+        for name, ids in samples().items():
+            bitmap = Bitmap.from_sorted(ids)
+            self.assertEqual(list(bitmap), ids, name)
+            self.assertEqual(len(bitmap), len(ids), name)
+            loaded = Bitmap.loads(bitmap.dumps())
+            self.assertEqual(loaded.containers, bitmap.containers, name)
+            self.assertEqual(list(loaded), ids, name)
+
+    def test_from_range(self):
+        for start, stop in ((0, 0), (5, 6), (0, CHUNK), (CHUNK - 1, CHUNK + 1), (100, 3 * CHUNK + 5)):
+            bitmap = Bitmap.from_range(start, stop)
+            self.assertEqual(list(bitmap), list(range(start, stop)), (start, stop))
+            self.assertEqual(list(Bitmap.loads(bitmap.dumps())), list(range(start, stop)), (start, stop))
+
+    def test_set_operations(self):
+        s = samples()
+        bitmaps = dict((name, Bitmap.from_sorted(ids)) for name, ids in s.items())
+        for a in s:
+            for b in s:
+                x, y = set(s[a]), set(s[b])
+                self.assertEqual(list(bitmaps[a] & bitmaps[b]), sorted(x & y), (a, 'and', b))
+                self.assertEqual(list(bitmaps[a] | bitmaps[b]), sorted(x | y), (a, 'or', b))
+                self.assertEqual(list(bitmaps[a] - bitmaps[b]), sorted(x - y), (a, 'not', b))
+
+    def test_results_stay_compact(self):
+        s = samples()
+        full = Bitmap.from_sorted(s['full chunk'])
+        # the result of a set operation switches back to the smallest container
+        self.assertEqual(kinds(full - Bitmap.from_sorted(s['full chunk - 1'])), [ARRAY])
+        self.assertEqual(kinds(full & Bitmap.from_sorted(s['array max'])), [ARRAY])
+        self.assertEqual((full - full).containers, {})
+        odd = Bitmap.from_sorted(range(1, 2 * ARRAY_MAX + 2, 2))
+        self.assertEqual(kinds(Bitmap.from_sorted(s['array max']) | odd), [RUN])
+        self.assertEqual((full & full).containers[0], (RUN, [(0, CHUNK)]))
+        self.assertEqual(kinds(Bitmap.from_sorted(s['random dense']) | full), [RUN, BITSET])
+
+
+if __name__ == '__main__':
+    unittest.main()
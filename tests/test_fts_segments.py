@@ -0,0 +1,51 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'zlogparser'))
+
+import loggen  # noqa: E402
+from preprocess import LogStream  # noqa: E402
+from storage import LogStorage  # noqa: E402
+
+QUERIES = ('consensus', 'timeout', 'received twice', '"gas used"', 'epoch NOT consensus', 'shard*', 'epoch NEAR/3 round')
+
+
+class FtsSegmentsTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        filepath = os.path.join(self.dir, 'node.txt')
+        loggen.generate(filepath, 1 << 20, seed=1)
+        logs = list(LogStream(filepath))
+        self.stores = []
+        for name, workers in (('single', 1), ('segments', 4)):
+            store = LogStorage(name, self.dir)
+            store.init()
+            store.create_log_table()
+            store.put_log_many(logs)
+            store.create_fulltext_index_fts(workers)
+            store.con.commit()
+            self.stores.append(store)
+
+    def tearDown(self):
+        del self.stores
+        shutil.rmtree(self.dir)
+
+    def test_merged_segments_match_single_build(self):
+        single, segments = self.stores
+        segdir = segments.con.execute('SELECT count(*) FROM ftsidx_segdir').fetchone()[0]
+        self.assertGreaterEqual(segdir, 4)
+        # raises sqlite3.DatabaseError on a malformed index
+        segments.con.execute("INSERT INTO ftsidx(ftsidx) VALUES('integrity-check')")
+        for q in QUERIES:
+            expected = single.search(q).fetchall()
+            self.assertTrue(expected, q)
+            self.assertEqual(segments.search(q).fetchall(), expected, q)
+        self.assertEqual([r[0] for r in segments.search_top('consensus round', 20)],
+                         [r[0] for r in single.search_top('consensus round', 20)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'zlogparser'))
+
+from storage import LogStorage  # noqa: E402
+
+MESSAGES = [
+    'DS epoch 12 shard 1 consensus round 3 started',
+    'Timeout while waiting for consensus round 2 of epoch 13',
+    'Block 14 received twice from <54.1.2.3:33133>',
+    'State Delta hash received from finalblock is null',
+    'Sending message to <54.1.2.4:33133> (Len=120)',
+]
+
+
+class FuzzySearchTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = LogStorage('node', self.dir)
+        self.store.init()
+        self.store.create_log_table()
+        self.store.put_log_many(
+            ['INFO', 1000 + i % 4, '2019-02-08 12:00:%02d.000' % i, 'a.cpp:1', 'Foo', MESSAGES[i % len(MESSAGES)]]
+            for i in range(50)
+        )
+        self.store.create_fulltext_index_fts()
+        self.store.create_vocabulary()
+
+    def tearDown(self):
+        del self.store
+        shutil.rmtree(self.dir)
+
+    def count(self, q):
+        return len(self.store.search(q).fetchall())
+
+    def test_typo_of_suffixed_word(self):
+        # the vocabulary holds porter stems, 'consensus' is stored as 'consensu'
+        q = self.store.fuzzy_query('consnsus')
+        self.assertIn('consensu', q)
+        self.assertEqual(self.count(q), self.count('consensus'))
+        self.assertGreater(self.count('consensus'), 0)
+
+    def test_transposition(self):
+        q = self.store.fuzzy_query('recieved')
+        self.assertEqual(self.count(q), self.count('received'))
+        self.assertGreater(self.count('received'), 0)
+
+    def test_exact_word_kept(self):
+        self.assertEqual(self.store.fuzzy_query('epoch'), 'epoch')
+        self.assertEqual(self.count(self.store.fuzzy_query('Timeout consnsus')), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
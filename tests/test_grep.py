@@ -0,0 +1,54 @@
+import os
+import re
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'zlogparser'))
+
+from storage import LogStorage  # noqa: E402
+from tokenizer import regex_literals  # noqa: E402
+
+
+class RegexLiteralsTest(unittest.TestCase):
+    def test_alternation(self):
+        self.assertEqual(regex_literals('(Timeout|twice)'), [['timeout'], ['twice']])
+        self.assertEqual(regex_literals(r'Block \d+ received (twice|again)'),
+                         [['block ', ' received ', 'twice'], ['block ', ' received ', 'again']])
+
+    def test_alternative_without_literal(self):
+        self.assertEqual(regex_literals('(Timeout|.*)'), [['timeout'], []])
+
+    def test_too_many_alternatives(self):
+        # the last alternation would make 32 alternatives, it contributes nothing
+        self.assertEqual(regex_literals('(aaa|bbb|ccc|ddd)(eee|fff|ggg|hhh)(iii|jjj) x'),
+                         [[l, m, ' x'] for l in ('aaa', 'bbb', 'ccc', 'ddd') for m in ('eee', 'fff', 'ggg', 'hhh')])
+
+
+class GrepTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = LogStorage('node', self.dir)
+        self.store.init()
+        self.store.create_log_table()
+        messages = ['Timeout while waiting for round %d', 'Block %d received twice', 'Committed %d transactions']
+        self.store.put_log_many([['INFO', 1000, '2019-02-08 12:00:%02d.000' % (i % 60), 'a.cpp:1', 'Foo',
+                                  messages[i % 3] % i] for i in range(300)])
+        self.store.create_trigram_index()
+
+    def tearDown(self):
+        del self.store
+        shutil.rmtree(self.dir)
+
+    def test_alternation_candidates(self):
+        pattern = '(Timeout|twice)'
+        stats = {}
+        rows = list(self.store.grep(re.compile(pattern).search, regex_literals(pattern), stats))
+        self.assertEqual(len(rows), 200)
+        self.assertEqual(stats['candidates'], 200)
+        self.assertEqual([r[0] for r in rows], sorted(r[0] for r in rows))
+
+
+if __name__ == '__main__':
+    unittest.main()
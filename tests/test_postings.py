@@ -0,0 +1,98 @@
+import os
+import random
+import sqlite3
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'zlogparser'))
+
+from postings import PostingsReader  # noqa: E402
+from postings import PostingsWriter  # noqa: E402
+from postings import decode_ids  # noqa: E402
+from postings import decode_positions  # noqa: E402
+from postings import difference  # noqa: E402
+from postings import encode_ids  # noqa: E402
+from postings import encode_positions  # noqa: E402
+from postings import intersect  # noqa: E402
+from postings import union  # noqa: E402
+
+
+class EncodingTest(unittest.TestCase):
+    def test_ids_round_trip(self):
+        for ids in ([], [1], [0], [127], [128], [1, 2, 3], [5, 5], [1, 1 << 40, (1 << 40) + 1, 1 << 62]):
+            self.assertEqual(list(decode_ids(bytes(encode_ids(ids)))), ids, ids)
+
+    def test_varint_sizes(self):
+        self.assertEqual(len(encode_ids([127])), 1)
+        self.assertEqual(len(encode_ids([128])), 2)
+        self.assertEqual(len(encode_ids([1000, 1127])), 3)
+
+    def test_positions_round_trip(self):
+        lists = [[0], [], [3, 200, 100000], list(range(300))]
+        buf = bytearray()
+        for positions in lists:
+            encode_positions(buf, positions)
+        self.assertEqual(list(decode_positions(bytes(buf))), lists)
+
+
+class MergeTest(unittest.TestCase):
+    def test_set_operations(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            sets = [set(rng.sample(range(100), rng.randint(0, 30))) for _ in range(rng.randint(1, 4))]
+            streams = [sorted(s) for s in sets]
+            self.assertEqual(list(intersect(streams)), sorted(set.intersection(*sets)))
+            self.assertEqual(list(union(streams)), sorted(set.union(*sets)))
+            self.assertEqual(list(difference(streams[0], sorted(set().union(*sets[1:])))),
+                             sorted(sets[0].difference(*sets[1:])))
+
+    def test_empty_streams(self):
+        self.assertEqual(list(intersect([])), [])
+        self.assertEqual(list(intersect([[1, 2], []])), [])
+        self.assertEqual(list(union([])), [])
+        self.assertEqual(list(difference([], [1])), [])
+        self.assertEqual(list(difference([1, 2], [])), [1, 2])
+
+
+class WriterTest(unittest.TestCase):
+    def setUp(self):
+        self.con = sqlite3.connect(':memory:')
+
+    def tearDown(self):
+        self.con.close()
+
+    def write(self, docs, chunk_size, positions=False):
+        writer = PostingsWriter(self.con, 'idx', chunk_size=chunk_size, positions=positions)
+        for doc_id, terms in docs:
+            writer.add(doc_id, terms)
+        writer.close()
+        return PostingsReader(self.con, 'idx')
+
+    def test_runs_merged(self):
+        rng = random.Random(1)
+        docs = [(i, set(rng.sample('abcdefgh', 3))) for i in sorted(set(rng.randint(1, 1 << 40) for _ in range(500)))]
+        for chunk_size in (1 << 20, 7, 1):
+            self.con.execute('DROP TABLE IF EXISTS idx')
+            reader = self.write(docs, chunk_size)
+            for term in 'abcdefghz':
+                expected = [i for i, terms in docs if term in terms]
+                self.assertEqual(list(reader.postings(term)), expected, (chunk_size, term))
+                self.assertEqual(reader.df(term), len(expected))
+
+    def test_duplicate_ids_across_runs(self):
+        # every add flushes a run, the same document is added again in the next one
+        reader = self.write([(1, ['a']), (2, ['a', 'b']), (2, ['a', 'c']), (3, ['a'])], chunk_size=1)
+        self.assertEqual(list(reader.postings('a')), [1, 2, 3])
+        self.assertEqual(reader.df('a'), 3)
+        self.assertEqual(list(reader.postings('c')), [2])
+        self.assertEqual(list(reader.all_of(['a', 'b', 'c'])), [2])
+
+    def test_positions_across_runs(self):
+        docs = [(1, {'a': [0, 2]}), (2, {'a': [1], 'b': [0]}), (5, {'b': [3, 4, 9]})]
+        reader = self.write(docs, chunk_size=2, positions=True)
+        self.assertEqual(list(reader.positions('a')), [(1, [0, 2]), (2, [1])])
+        self.assertEqual(list(reader.positions('b')), [(2, [0]), (5, [3, 4, 9])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'zlogparser'))
+
+from preprocess import TRUNCATED_MARK  # noqa: E402
+from preprocess import LogStream  # noqa: E402
+
+HEADER = '[INFO ][ 1000][19-02-08T12:00:00.%03d][a.cpp:1             ][Foo                 ] %s\n'
+
+
+class MessageCapTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'node.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, lines):
+        with open(self.path, 'w') as f:
+            f.writelines(lines)
+
+    def test_no_splice_after_dropped_line(self):
+        long_lines = ['%s\n' % (chr(ord('a') + i) * 99) for i in range(5)]
+        self.write([HEADER % (0, 'Storing StateDelta:')] + long_lines + ['short 123\n', HEADER % (1, 'END')])
+        logs = list(LogStream(self.path, 250))
+        self.assertEqual(len(logs), 2)
+        msg = logs[0][-1]
+        dropped = sum(len(l) + 1 for l in long_lines[2:]) + len('short 123\n') + 1
+        self.assertEqual(msg, '\n'.join(['Storing StateDelta:'] + long_lines[:2]) + TRUNCATED_MARK % dropped)
+        self.assertNotIn('short', msg)
+        self.assertEqual(logs[1][-1], 'END')
+
+    def test_long_first_line(self):
+        self.write([HEADER % (0, 'x' * 300), HEADER % (1, 'END')])
+        stream = LogStream(self.path, 100)
+        logs = list(stream)
+        self.assertEqual(logs[0][-1], 'x' * 100 + TRUNCATED_MARK % 200)
+        self.assertEqual(stream.truncated, 1)
+
+    def test_no_limit(self):
+        lines = [HEADER % (0, 'Storing:')] + ['%s\n' % ('y' * 99)] * 50
+        self.write(lines)
+        self.assertEqual(len(list(LogStream(self.path, 0))[0][-1]), len('Storing:') + 50 * 101)
+
+    def test_negative_limit(self):
+        self.write([HEADER % (0, 'END')])
+        self.assertRaises(ValueError, LogStream, self.path, -1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'zlogparser'))
+
+import progress  # noqa: E402
+
+
+class ProgressStatusTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.files = []
+        for name in ('indexed', 'failed', 'done', 'parsing'):
+            path = os.path.join(self.dir, name + '.txt')
+            with open(path, 'w') as f:
+                f.write('x' * 1000)
+            self.files.append(path)
+        self.progress = progress.Progress(self.files)
+        progress.init_worker(*self.progress.initargs)
+
+    def tearDown(self):
+        progress._shared = None
+        shutil.rmtree(self.dir)
+
+    def test_files_without_timings(self):
+        now = time.time()
+        self.progress.t = now - 10
+        a, fields = self.progress.array, progress.FIELDS
+        # already indexed: DONE only
+        a[0 * fields + progress.STATE] = progress.DONE
+        a[0 * fields + progress.FINISHED] = now - 9
+        # failed while inserting: STARTED then DONE
+        a[1 * fields + progress.STARTED] = now - 9
+        a[1 * fields + progress.FINISHED] = now - 8
+        a[1 * fields + progress.STATE] = progress.DONE
+        # parsed in 2 seconds, indexed in 2 seconds
+        a[2 * fields + progress.STARTED] = now - 8
+        a[2 * fields + progress.INDEXED] = now - 6
+        a[2 * fields + progress.FINISHED] = now - 4
+        a[2 * fields + progress.STATE] = progress.DONE
+        # half parsed
+        a[3 * fields + progress.STARTED] = now - 4
+        a[3 * fields + progress.BYTES] = 500
+        a[3 * fields + progress.STATE] = progress.INSERTING
+        line = self.progress.status(now)
+        # parsing is half of the work by the only timed file: 3 files done and half parsed the last one
+        self.assertTrue(line.startswith('[ 81.2%]'), line)
+        self.assertIn('ETA 0:00:02', line)
+
+
+if __name__ == '__main__':
+    unittest.main()
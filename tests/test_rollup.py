@@ -0,0 +1,44 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'zlogparser'))
+
+from rollup import Rollup  # noqa: E402
+from storage import LogStorage  # noqa: E402
+
+
+class RollupRangeTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = LogStorage('node', self.dir)
+        self.store.init()
+        self.store.create_log_table()
+        # one log every 7 seconds from 12:00:00 to 12:09:55
+        logs = [['INFO', 1000, '2019-02-08 12:%02d:%02d.%03d' % (s // 60, s % 60, s % 1000), 'a.cpp:1', 'Foo', 'msg']
+                for s in range(0, 600, 7)]
+        self.store.put_log_many(logs)
+        counters = Rollup(self.store, '1m')
+        counters.add_many(logs)
+        counters.close()
+
+    def tearDown(self):
+        del self.store
+        shutil.rmtree(self.dir)
+
+    def test_messages_cover_the_rollup_buckets(self):
+        for start, end in (('2019-02-08 12:00', '2019-02-08 12:02'),
+                           ('2019-02-08 12:01:30', '2019-02-08 12:05:10.5'),
+                           (None, '2019-02-08 12:03'),
+                           ('2019-02-08 12:08', None),
+                           (None, None)):
+            counted = sum(c for _, c in self.store.rollup_counts('function', start, end))
+            self.assertEqual(len(self.store.messages(start, end).fetchall()), counted, (start, end))
+        first, last = self.store.rollup_buckets('2019-02-08 12:00', '2019-02-08 12:02')
+        self.assertEqual((first, last), ('2019-02-08 12:00', '2019-02-08 12:02'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'zlogparser'))
+
+from storage import LogStorage  # noqa: E402
+from storage import split_or  # noqa: E402
+
+MESSAGES = ['DS epoch %d consensus started', 'shard %d processing microblock', 'epoch %d shard done',
+            'peer not responding']
+
+
+class SearchPyTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = LogStorage('node', self.dir)
+        self.store.init()
+        self.store.create_log_table()
+        self.store.put_log_many([['INFO', 1000, '2019-02-08 12:00:%02d.000' % (i % 60), 'a.cpp:1', 'Foo',
+                                  MESSAGES[i % 4] % i if '%' in MESSAGES[i % 4] else MESSAGES[i % 4]]
+                                 for i in range(200)])
+        self.store.create_fulltext_index_fts()
+        self.store.create_fulltext_index_py()
+
+    def tearDown(self):
+        del self.store
+        shutil.rmtree(self.dir)
+
+    def test_split_or(self):
+        self.assertEqual(split_or('epoch OR shard'), ['epoch', 'shard'])
+        self.assertEqual(split_or('a b OR "c d" NOT e'), ['a b', '"c d" NOT e'])
+        self.assertRaises(ValueError, split_or, 'a (b OR c)')
+
+    def test_or_matches_fts(self):
+        for q in ('epoch OR shard', 'consensus OR responding', 'epoch shard OR peer', 'epoch NOT shard OR microblock',
+                  '"shard done" OR "consensus started"'):
+            expected = [r[0] for r in self.store.search(q)]
+            self.assertTrue(expected, q)
+            self.assertEqual(list(self.store.search_py_ids(q)), expected, q)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'zlogparser'))
+
+from spans import iter_folded  # noqa: E402
+
+
+def calls(events, tid=1000):
+    """
+    BEG/END rows of (seconds, function, message) events
+    """
+    return [(lid, tid, '2019-02-08 12:00:%06.3f' % t, function, function.lower() + '.cpp:1', message)
+            for lid, (t, function, message) in enumerate(events, 1)]
+
+
+class FoldedStacksTest(unittest.TestCase):
+    def test_self_time(self):
+        rows = calls([(0, 'A', 'BEG'), (1, 'B', 'BEG'), (3, 'B', 'END'), (4, 'C', 'BEG'), (5, 'C', 'END'),
+                      (10, 'A', 'END')])
+        self.assertEqual(sorted(iter_folded(rows)), [('A', 7000), ('A;B', 2000), ('A;C', 1000)])
+
+    def test_unmatched_frames(self):
+        # C never ends, its child D is not a child of B, nor of F opened later at the same depth
+        rows = calls([(0, 'A', 'BEG'), (1, 'B', 'BEG'), (2, 'C', 'BEG'), (3, 'D', 'BEG'), (8, 'D', 'END'),
+                      (10, 'B', 'END'), (11, 'E', 'BEG'), (12, 'F', 'BEG'), (13, 'F', 'END'), (14, 'E', 'END'),
+                      (15, 'A', 'END')])
+        self.assertEqual(sorted(iter_folded(rows)),
+                         [('A', 3000), ('A;B', 9000), ('A;B;C;D', 5000), ('A;E', 2000), ('A;E;F', 1000)])
+
+    def test_per_thread(self):
+        rows = calls([(0, 'A', 'BEG'), (1, 'A', 'END')]) + calls([(0, 'A', 'BEG'), (2, 'A', 'END')], tid=7)
+        rows = [(lid,) + row[1:] for lid, row in enumerate(rows, 1)]
+        self.assertEqual(sorted(iter_folded(rows, per_thread=True)),
+                         [('thread 1000;A', 1000), ('thread 7;A', 2000)])
+
+
+if __name__ == '__main__':
+    unittest.main()
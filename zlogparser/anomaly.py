@@ -0,0 +1,116 @@
+"""
+Streaming detection of silences and rate spikes, fed with the logs as they are inserted.
+
+Logs are counted per second for the whole node, for every level and for every
+thread. The counts are compared with an exponentially weighted moving average
+and variance of the previous seconds, a second far above the baseline is a
+spike. A node or a thread without any log for too long is a gap.
+The state is a few numbers per key, so the detector can be fed forever.
+"""
+import logging
+import math
+
+from spans import puttime_seconds
+from spans import seconds_puttime
+
+LOG = logging.getLogger()
+
+GAP = 10.0  # seconds without any log of the node
+THREAD_GAP = 60.0  # seconds without any log of a thread
+ALPHA = 0.05  # weight of the last second in the baseline
+SIGMA = 4.0  # a spike is above the baseline by SIGMA standard deviations
+MIN_SPIKE = 20  # and has at least MIN_SPIKE logs
+WARMUP = 60  # seconds counted before spikes are reported
+MAX_DECAY = 1000  # idle seconds after which the baseline is back to zero
+
+GAP_EVENT = 'gap'
+SPIKE_EVENT = 'spike'
+
+
+class Rate(object):
+    """
+    per second count of one key and its EWMA baseline
+    """
+    __slots__ = ('second', 'count', 'mean', 'var', 'seen')
+
+    def __init__(self):
+        self.second = None
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.seen = 0
+
+    def update(self, x):
+        diff = x - self.mean
+        incr = ALPHA * diff
+        self.mean += incr
+        self.var = (1 - ALPHA) * (self.var + diff * incr)
+        self.seen += 1
+
+    def close(self, key, events):
+        """
+        closes the current second, appends a spike event if any
+        """
+        if self.second is None:
+            return
+        if (self.seen >= WARMUP and self.count >= MIN_SPIKE and
+                self.count > self.mean + SIGMA * math.sqrt(self.var)):
+            events.append((SPIKE_EVENT, key, self.second, self.second + 1, self.count, self.mean))
+        self.update(self.count)
+
+    def add(self, key, second, events):
+        # logs of other threads may be slightly out of order, late ones count in the current second
+        if self.second is None or second > self.second:
+            self.close(key, events)
+            if self.second is not None:
+                for _ in range(min(second - self.second - 1, MAX_DECAY)):
+                    self.update(0)
+            self.second = second
+            self.count = 0
+        self.count += 1
+
+
+class Detector(object):
+    def __init__(self, store, gap=GAP, thread_gap=THREAD_GAP):
+        self.store = store
+        self.gap = gap
+        self.thread_gap = thread_gap
+        self.rates = {}
+        self.last = {}  # key -> seconds of its last log, for gaps
+        self.events = []
+        store.create_events_table()
+
+    def _gap(self, key, t, threshold):
+        last = self.last.get(key)
+        if last is None or t > last:
+            if last is not None and t - last > threshold:
+                self.events.append((GAP_EVENT, key, last, t, t - last, threshold))
+            self.last[key] = t
+
+    def add(self, log):
+        level, tid, puttime = log[:3]
+        t = puttime_seconds(puttime)
+        second = int(t)
+        self._gap('node', t, self.gap)
+        self._gap('tid=%s' % tid, t, self.thread_gap)
+        for key in ('node', 'level=' + level, 'tid=%s' % tid):
+            rate = self.rates.get(key)
+            if rate is None:
+                rate = self.rates[key] = Rate()
+            rate.add(key, second, self.events)
+
+    def add_many(self, logs):
+        for log in logs:
+            self.add(log)
+        if self.events:
+            self.flush()
+
+    def flush(self):
+        self.store.put_events((kind, key, seconds_puttime(start), seconds_puttime(end), value, baseline)
+                              for kind, key, start, end, value, baseline in self.events)
+        self.events = []
+
+    def close(self):
+        for key, rate in self.rates.items():
+            rate.close(key, self.events)
+        self.flush()
@@ -0,0 +1,243 @@
+"""
+Roaring-style compressed bitmaps of log ids.
+
+Ids are split by their high 16 bits into containers holding the low 16 bits,
+a container is one of:
+    - ARRAY:  sorted list of the low bits, for sparse chunks
+    - BITSET: a python int used as a 65536 bits bitset, for dense chunks
+    - RUN:    list of (start, length) runs, for consecutive ids
+Set operations between containers of different kinds are done on bitsets.
+"""
+import struct
+import sys
+
+ARRAY = 0
+BITSET = 1
+RUN = 2
+
+CHUNK = 1 << 16
+ARRAY_MAX = 4096  # above that an array is bigger than a bitset (8Kb)
+
+_BITS = [tuple(b for b in range(8) if i & (1 << b)) for i in range(256)]
+
+if sys.version_info[0] < 3:
+    import binascii
+
+    def _int_from_bytes(b):
+        return int(binascii.hexlify(bytes(b[::-1])), 16) if b else 0
+
+    def _int_to_bytes(n):
+        h = '%x' % n
+        return bytearray(binascii.unhexlify(('0' * (len(h) % 2)) + h)[::-1])
+else:
+    def _int_from_bytes(b):
+        return int.from_bytes(bytes(b), 'little')
+
+    def _int_to_bytes(n):
+        return bytearray(n.to_bytes((n.bit_length() + 7) // 8, 'little'))
+
+
+def _bitset_values(n):
+    for i, byte in enumerate(_int_to_bytes(n)):
+        if byte:
+            base = i * 8
+            for b in _BITS[byte]:
+                yield base + b
+
+
+def _to_bitset(kind, data):
+    if kind == BITSET:
+        return data
+    if kind == RUN:
+        n = 0
+        for start, length in data:
+            n |= ((1 << length) - 1) << start
+        return n
+    buf = bytearray(CHUNK // 8)
+    for v in data:
+        buf[v >> 3] |= 1 << (v & 7)
+    return _int_from_bytes(buf)
+
+
+def _values(kind, data):
+    if kind == ARRAY:
+        return iter(data)
+    if kind == RUN:
+        return (v for start, length in data for v in range(start, start + length))
+    return _bitset_values(data)
+
+
+def _runs(values):
+    runs = []
+    start = last = None
+    for v in values:
+        if last is not None and v == last + 1:
+            last = v
+            continue
+        if start is not None:
+            runs.append((start, last - start + 1))
+        start = last = v
+    if start is not None:
+        runs.append((start, last - start + 1))
+    return runs
+
+
+def _container(values):
+    """
+    the smallest container of the sorted low bits values, None if empty
+    """
+    if not values:
+        return None
+    runs = _runs(values)
+    if len(runs) * 4 < min(len(values) * 2, CHUNK // 8):
+        return RUN, runs
+    if len(values) <= ARRAY_MAX:
+        return ARRAY, values
+    return BITSET, _to_bitset(ARRAY, values)
+
+
+def _from_bitset(n):
+    if not n:
+        return None
+    count = bin(n).count('1')
+    if count <= ARRAY_MAX:
+        return _container(list(_bitset_values(n)))
+    # a run starts at every set bit whose lower neighbour is not set
+    if bin(n & ~(n << 1)).count('1') * 4 < CHUNK // 8:
+        return RUN, _runs(_bitset_values(n))
+    return BITSET, n
+
+
+class Bitmap(object):
+    def __init__(self, containers=None):
+        self.containers = containers or {}  # high bits -> (kind, data)
+
+    @classmethod
+    def from_sorted(cls, ids):
+        builder = BitmapBuilder()
+        for i in ids:
+            builder.add(i)
+        return builder.build()
+
+    @classmethod
+    def from_range(cls, start, stop):
+        """
+        the bitmap of ids in [start, stop)
+        """
+        containers = {}
+        for high in range(start >> 16, ((stop - 1) >> 16) + 1 if stop > start else 0):
+            lo = max(start, high << 16) & 0xffff
+            hi = min(stop, (high + 1) << 16) - (high << 16)
+            containers[high] = (RUN, [(lo, hi - lo)])
+        return cls(containers)
+
+    def __iter__(self):
+        for high in sorted(self.containers):
+            base = high << 16
+            for v in _values(*self.containers[high]):
+                yield base + v
+
+    def __len__(self):
+        total = 0
+        for kind, data in self.containers.values():
+            if kind == ARRAY:
+                total += len(data)
+            elif kind == RUN:
+                total += sum(length for _, length in data)
+            else:
+                total += bin(data).count('1')
+        return total
+
+    def _combine(self, other, op, keys):
+        containers = {}
+        for high in keys:
+            a = self.containers.get(high)
+            b = other.containers.get(high)
+            if a is None or b is None:
+                c = a or b if op == 'or' else (a if op == 'andnot' else None)
+            elif op == 'and' and a[0] == ARRAY and b[0] == ARRAY:
+                c = _container(sorted(set(a[1]).intersection(b[1])))
+            elif op == 'or' and a[0] == ARRAY and b[0] == ARRAY and len(a[1]) + len(b[1]) <= ARRAY_MAX:
+                c = _container(sorted(set(a[1]).union(b[1])))
+            else:
+                x, y = _to_bitset(*a), _to_bitset(*b)
+                c = _from_bitset(x & y if op == 'and' else x | y if op == 'or' else x & ~y)
+            if c is not None:
+                containers[high] = c
+        return Bitmap(containers)
+
+    def __and__(self, other):
+        return self._combine(other, 'and', set(self.containers).intersection(other.containers))
+
+    def __or__(self, other):
+        return self._combine(other, 'or', set(self.containers).union(other.containers))
+
+    def __sub__(self, other):
+        return self._combine(other, 'andnot', self.containers)
+
+    def dumps(self):
+        buf = bytearray()
+        for high in sorted(self.containers):
+            kind, data = self.containers[high]
+            if kind == BITSET:
+                payload = _int_to_bytes(data)
+                count = len(payload)
+            elif kind == RUN:
+                payload = struct.pack('<%dH' % (len(data) * 2), *[v for start, length in data
+                                                                 for v in (start, length - 1)])
+                count = len(data)
+            else:
+                payload = struct.pack('<%dH' % len(data), *data)
+                count = len(data)
+            buf.extend(struct.pack('<HBI', high, kind, count))
+            buf.extend(payload)
+        return buf
+
+    @classmethod
+    def loads(cls, blob):
+        blob = bytes(blob)
+        containers = {}
+        offset = 0
+        header = struct.calcsize('<HBI')
+        while offset < len(blob):
+            high, kind, count = struct.unpack_from('<HBI', blob, offset)
+            offset += header
+            if kind == BITSET:
+                containers[high] = kind, _int_from_bytes(bytearray(blob[offset:offset + count]))
+                offset += count
+            elif kind == RUN:
+                values = struct.unpack_from('<%dH' % (count * 2), blob, offset)
+                containers[high] = kind, [(values[i], values[i + 1] + 1) for i in range(0, len(values), 2)]
+                offset += count * 4
+            else:
+                containers[high] = kind, list(struct.unpack_from('<%dH' % count, blob, offset))
+                offset += count * 2
+        return cls(containers)
+
+
+class BitmapBuilder(object):
+    """
+    builds a Bitmap from ids added in ascending order, only the current chunk is kept uncompressed
+    """
+
+    def __init__(self):
+        self.containers = {}
+        self._high = None
+        self._values = []
+
+    def add(self, i):
+        high = i >> 16
+        if high != self._high:
+            self._seal()
+            self._high = high
+        self._values.append(i & 0xffff)
+
+    def _seal(self):
+        c = _container(self._values)
+        if c is not None:
+            self.containers[self._high] = c
+        self._values = []
+
+    def build(self):
+        self._seal()
+        return Bitmap(self.containers)
@@ -0,0 +1,166 @@
+"""
+Seeded generator of synthetic Zilliqa node logs, for benchmarks and tests.
+
+The logs have the layout of the real ones: BEG/END of nested calls on many
+threads, functions and files taken from the ctags index so that recovery works,
+multi-line TxBlock dumps, block and public key hashes, peers as ip:port and
+occasional warnings. Several nodes share the same block schedule, every node
+receiving each block with its own delay, so they can be compared.
+"""
+from __future__ import print_function
+
+import datetime
+import hashlib
+import os
+import random
+
+import tagindex
+
+START = datetime.datetime(2019, 2, 8, 12, 0, 0)
+
+BLOCK_INTERVAL = 5.0  # seconds between two blocks
+
+MAX_DEPTH = 8
+
+LINE_FORMAT = '[%-5s][%5d][%s][%-20s][%-20s] %s\n'
+
+MESSAGES = (
+    'Incoming broadcast <{addr}> (Len={length}): {payload}',
+    'Sending message to <{addr}> (Len={length})',
+    'State Delta hash received from finalblock is null, skip processing state delta epoch {epoch}',
+    'DS epoch {epoch} shard {shard} consensus round {round} started, leader {pubkey}',
+    'Processing microblock from shard {shard} with {txns} transactions, epoch {epoch}',
+    'Committed {txns} transactions, state root 0x{hash}',
+    'Gas used = {gas}, gas limit = {limit}',
+)
+
+WARNINGS = (
+    'Timeout while waiting for consensus round {round} of epoch {epoch}',
+    'Peer <{addr}> not responding, retry {retry}',
+    'Block {blocknum} received twice from <{addr}>',
+)
+
+FATALS = (
+    'Assertion failed: state delta of epoch {epoch} mismatch',
+)
+
+TXBLOCK = '''Storing TxBlock:
+<TxBlock>
+ m_blockHash = {hash}
+ m_blockNum    = {blocknum}
+ m_minerPubKey = 0x{pubkey}
+ m_gasLimit    = {limit}
+ m_gasUsed     = {gas}
+ t.m_shardId        = {shard}
+ m_prevHash = {prev}
+</TxBlock>'''
+
+
+def _functions(rng, count=200):
+    """
+    (function, fileline) columns of functions of the ctags index, truncated like the real logs
+    """
+    tags = sorted(t for t in tagindex.tags if '/src/lib' in t[1] and t[1].endswith('.cpp'))
+    functions = []
+    for name, path, lineno in rng.sample(tags, min(count, len(tags))):
+        fileline = '%s:%s' % (os.path.basename(path), lineno + rng.randint(1, 30))
+        functions.append((name[:20], fileline[-20:]))
+    return functions
+
+
+def block_hash(seed, blocknum):
+    return hashlib.sha256(('%s:%s' % (seed, blocknum)).encode()).hexdigest()
+
+
+class NodeLog(object):
+    def __init__(self, seed, node, threads=16):
+        self.seed = seed
+        self.rng = random.Random('%s:%s' % (seed, node))
+        self.functions = _functions(random.Random(seed))  # same functions on every node
+        self.stacks = dict((1000 + i * 7, []) for i in range(threads))
+        self.tids = sorted(self.stacks)
+        self.peers = ['%d.%d.%d.%d:%d' % (54, self.rng.randint(0, 255), self.rng.randint(0, 255),
+                                          self.rng.randint(1, 254), 33133) for _ in range(64)]
+        self.delay = self.rng.uniform(0.01, 0.5)  # how late this node gets the blocks
+        self.now = START
+        self.blocknum = 0
+
+    def _fields(self):
+        rng = self.rng
+        return {
+            'addr': rng.choice(self.peers),
+            'length': rng.randint(40, 90000),
+            'payload': '%x' % rng.getrandbits(64),
+            'epoch': self.blocknum,
+            'blocknum': self.blocknum,
+            'shard': rng.randint(0, 3),
+            'round': rng.randint(1, 5),
+            'retry': rng.randint(1, 3),
+            'txns': rng.randint(0, 2000),
+            'gas': rng.randint(0, 10 ** 6),
+            'limit': 10 ** 6,
+            'hash': '%064x' % rng.getrandbits(256),
+            'pubkey': '02%064X' % rng.getrandbits(256),
+        }
+
+    def lines(self):
+        """
+        yields the log lines forever
+        """
+        rng = self.rng
+        while True:
+            self.now += datetime.timedelta(microseconds=rng.randint(100, 20000))
+            ts = self.now.strftime('%y-%m-%dT%H:%M:%S.%f')[:-3]
+            tid = rng.choice(self.tids)
+            stack = self.stacks[tid]
+            # a new block reaches this node
+            blocknum = int(((self.now - START).total_seconds() - self.delay) // BLOCK_INTERVAL)
+            if blocknum > self.blocknum:
+                self.blocknum = blocknum
+                function, fileline = stack[-1] if stack else self.functions[0]
+                fields = self._fields()
+                fields['hash'] = block_hash(self.seed, blocknum)
+                fields['prev'] = block_hash(self.seed, blocknum - 1)
+                yield LINE_FORMAT % ('INFO', tid, ts, fileline, function, TXBLOCK.format(**fields))
+                continue
+            r = rng.random()
+            if r < 0.25 and len(stack) < MAX_DEPTH:
+                stack.append(rng.choice(self.functions))
+                yield LINE_FORMAT % ('INFO', tid, ts, stack[-1][1], stack[-1][0], 'BEG')
+            elif r < 0.5 and stack:
+                function, fileline = stack.pop()
+                yield LINE_FORMAT % ('INFO', tid, ts, fileline, function, 'END')
+            else:
+                function, fileline = stack[-1] if stack else rng.choice(self.functions)
+                level = 'INFO' if r < 0.97 else 'DEBUG' if r < 0.99 else 'WARNING' if r < 0.9995 else 'FATAL'
+                templates = WARNINGS if level == 'WARNING' else FATALS if level == 'FATAL' else MESSAGES
+                yield LINE_FORMAT % (level, tid, ts, fileline, function, rng.choice(templates).format(**self._fields()))
+
+
+def generate(path, size, seed=0, node=None, threads=16):
+    """
+    write about size bytes of the logs of a node to path, returns the number of lines
+    """
+    node = node or os.path.basename(path).rpartition('.')[0]
+    written = count = 0
+    with open(path, 'w') as fp:
+        for line in NodeLog(seed, node, threads).lines():
+            fp.write(line)
+            written += len(line)
+            count += 1
+            if written >= size:
+                break
+    return count
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) < 3:
+        print('usage: python loggen.py OUTPUT_DIR SIZE_MB [SEED] [NODES]')
+        sys.exit(2)
+    out_dir, size_mb = sys.argv[1], float(sys.argv[2])
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    for n in range(int(sys.argv[4]) if len(sys.argv) > 4 else 1):
+        filepath = os.path.join(out_dir, 'node-%d.txt' % n)
+        print(filepath, generate(filepath, int(size_mb * 1024 * 1024), seed))
@@ -1,17 +1,36 @@
 from __future__ import print_function
 
 import argparse
+import datetime
 import glob
+import json
 import logging
+import math
 import os
+import re
 import sys
 import time
+from collections import Counter
+from collections import OrderedDict
 from contextlib import contextmanager
+from functools import partial
 
+import anomaly
+import profiling
+import progress
 import recovery
+import rollup
+import spans
+from preprocess import MAX_MESSAGE
 from preprocess import LogStream
+from sketch import Sketch
 from storage import LogStorage
+from tokenizer import message_template
+from tokenizer import regex_literals
+from tokenizer import stem_cache
 from utils import indent_block
+from utils import PY2
+from utils import measure_time
 from utils import parse_puttime
 from utils import shorten_time
 
@@ -28,25 +47,27 @@ root_logger.setLevel(LOG_LEVEL)
 LOG = root_logger
 
 INDEX_STORAGE = './log-cache'
+STEM_CACHE = 'stem-cache.marshal'
+
+HEX_PREFIX_REG = re.compile(r'^(0[xX])?[0-9a-fA-F]+$')
 
 
 class AlreadyExistsError(Exception):
     pass
 
 
-@contextmanager
-def measure_time(name):
-    t = time.time()
-    yield
-    LOG.info("%s done. Cost: %.1f sec" % (name, time.time() - t))
-
-
-def index_file(filepath):
+def index_file(filepath, trigram=False, fts=True, granularity='1m', gap=anomaly.GAP, max_message=MAX_MESSAGE,
+               profile=False, profile_dir=None):
+    """
+    index a log file in a worker process, returns the profiling snapshot of the worker when profile
+    """
     LOG = logging.getLogger()
     console_handler.setFormatter(logging.Formatter('[%(levelname)-5s][%(name)-32s][%(process)-5d] %(message)s'))
     LOG.name = 'indexer:%s' % filepath.split('/')[-1]
+    profiler = profiling.start(profile_dir) if profile else None
+    tracker = progress.FileProgress(filepath)
     try:
-        stream = LogStream(filepath)
+        stream = LogStream(filepath, max_message)
         LOG.info('indexing: ' + stream.node)
         store = LogStorage(stream.node, './log-cache')
         if os.path.isfile(store.path):
@@ -54,44 +75,108 @@ def index_file(filepath):
             raise AlreadyExistsError()
         store.init()
         store.create_log_table()
+        counters = rollup.Rollup(store, granularity)
+        detector = anomaly.Detector(store, gap)
         bulk_size = 256
         buf = []
+        records = 0
+        tracker.state(progress.INSERTING)
         # with storage.transaction_context():
         with measure_time("insert log"):
             for l in stream:
                 buf.append(l)
                 if len(buf) == bulk_size:
                     store.put_log_many(buf)
+                    counters.add_many(buf)
+                    detector.add_many(buf)
+                    profiling.count('records parsed', bulk_size)
+                    records += bulk_size
+                    tracker.update(stream.tell(), records)
                     buf = []
             if buf:
                 store.put_log_many(buf)
+                counters.add_many(buf)
+                detector.add_many(buf)
+                profiling.count('records parsed', len(buf))
+            counters.close()
+            detector.close()
+            profiling.count('bytes read', os.path.getsize(filepath))
+        tracker.update(stream.tell(), records + len(buf))
+        tracker.state(progress.INDEXING)
+        if stream.truncated:
+            LOG.warning('%d messages longer than %d bytes truncated' % (stream.truncated, max_message))
+            profiling.count('messages truncated', stream.truncated)
         with measure_time("create index"):
             store.create_index()
+        with measure_time("create bitmap index"):
+            store.create_bitmap_index()
+        with measure_time("create span index"):
+            store.create_span_index()
         with measure_time("generate items"):
             store.gen_items()
-        with measure_time("create full-text index"):
-            store.create_fulltext_index_fts()
+        if fts:
+            with measure_time("create full-text index"):
+                store.create_fulltext_index_fts()
+            with measure_time("create vocabulary"):
+                store.create_vocabulary()
+        with measure_time("create hash index"):
+            store.create_hash_index()
+        with measure_time("create peer index"):
+            store.create_peer_index()
+        with measure_time("create key/value index"):
+            store.create_kv_index()
+        if trigram:
+            with measure_time("create trigram index"):
+                store.create_trigram_index()
+        profiling.count('rows written', store.con.total_changes)
         LOG.info('done indexing: ' + stream.node)
     except AlreadyExistsError:
-        return
+        pass
     except:
         LOG.exception('error while indexing file: ' + filepath)
+    tracker.state(progress.DONE)
+    if profile:
+        profiling.stop(profiler, os.path.basename(filepath))
+        return profiling.snapshot()
 
 
-def index_cmd(*files):
+def index_cmd(files, trigram=False, fts_workers=1, granularity='1m', gap=anomaly.GAP, max_message=MAX_MESSAGE,
+              memory_budget=None):
     for f in files:
         if not os.path.isfile(f):
             raise AttributeError('%s not exists or is not a file' % f)
+    if max_message < 0:
+        LOG.error('--max-message must be 0 (no limit) or a positive number of bytes')
+        sys.exit(1)
 
     from multiprocessing import Pool, cpu_count
 
     workers = cpu_count()
-    pool = Pool(workers)
+    tracker = progress.Progress(files)
+    pool = Pool(workers, progress.init_worker, tracker.initargs)
 
     size = sum(os.stat(i).st_size for i in files)
     t = time.time()
     try:
-        pool.map(index_file, files)
+        # pool workers can't have children, so sharded full-text indexes are built afterwards from here
+        func = partial(index_file, trigram=trigram, fts=fts_workers <= 1, granularity=granularity, gap=gap,
+                       max_message=max_message, profile=profiling.enabled, profile_dir=profiling.output_dir)
+        if memory_budget:
+            snapshots = tracker.run(pool, func, workers, memory_budget)
+        else:
+            snapshots = tracker.wait(pool.map_async(func, files))
+        for snapshot in snapshots:
+            profiling.add(snapshot)
+        if fts_workers > 1:
+            for f in files:
+                store = LogStorage(LogStream(f).node, INDEX_STORAGE)
+                if store.is_fts():
+                    continue
+                LOG.info('creating sharded full-text index: ' + store.node)
+                with measure_time("create full-text index"):
+                    store.create_fulltext_index_fts(fts_workers)
+                with measure_time("create vocabulary"):
+                    store.create_vocabulary()
     except KeyboardInterrupt:
         pool.terminate()
     dur = time.time() - t
@@ -149,14 +234,23 @@ def list_cmd(item, node=None, recover=False):
             print('\n'.join(sorted(i[0] for i in cur)))
 
 
-def print_rows(cur, recover):
-    for l in cur:
-        _, level, tid, puttime, fileline, function, message = l
-        if recover:
-            function, filepath, lineno = recovery.recover(function, fileline)
-            function = '%-40s' % function
-            fileline = '%-50s:%-4s' % (filepath, lineno)
-        print('  '.join([level, '{:5}'.format(tid), puttime, fileline, function, message]))
+def format_rows(rows, recover, columns=None):
+    if recover:
+        recovered = recovery.recover_block(rows, columns)
+    else:
+        recovered = [(r[5], r[4]) for r in rows]
+    return [
+        '  '.join([level, '{:5}'.format(tid), puttime, fileline, function, message])
+        for (_, level, tid, puttime, _, _, message), (function, fileline) in zip(rows, recovered)
+    ]
+
+
+def print_rows(cur, recover, block_size=4096):
+    # rows are recovered and written block by block, so that '-r' costs one lookup per distinct
+    # (function, fileline) instead of one per row
+    columns = {}
+    for rows in recovery.iter_blocks(cur, block_size):
+        sys.stdout.write('\n'.join(format_rows(rows, recover, columns)) + '\n')
 
 
 def range_cmd(node, start, end, recover=False):
@@ -173,16 +267,428 @@ def query_cmd(node, query_string, recover=False):
     print_rows(cur, recover)
 
 
-def full_text_index_cmd():
-    pass
+def full_text_index_cmd(node):
+    store = get_node_storage(node)
+    cache_path = os.path.join(INDEX_STORAGE, STEM_CACHE)
+    LOG.info('preloaded %s stems' % stem_cache.load(cache_path))
+    with measure_time("create postings index"):
+        store.create_fulltext_index_py()
+    stem_cache.dump(cache_path)
 
 
-def search_cmd(node, keywords, recover=False):
+def search_cmd(node, keywords, recover=False, engine='fts', top=None, recency=0.0, newest=False, snippet=False,
+               fuzzy=0):
     store = get_node_storage(node)
-    cur = store.search(keywords)
+    if fuzzy:
+        if engine != 'fts' or not store.is_vocabulary():
+            LOG.error('--fuzzy needs the fts engine and the vocabulary, re-index the log of %s' % node)
+            sys.exit(1)
+        keywords = store.fuzzy_query(keywords, fuzzy)
+        LOG.info('fuzzy query: %s' % keywords)
+    if (recency or newest or snippet) and not top:
+        LOG.error('--recency, --newest and --snippet work with --top only')
+        sys.exit(1)
+    if top:
+        if engine != 'fts':
+            LOG.error('--top works with the fts engine only')
+            sys.exit(1)
+        marks = ('\033[1;31m', '\033[0m') if sys.stdout.isatty() else ('**', '**')
+        cur = store.search_top(keywords, top, recency, newest, marks if snippet else None)
+    elif engine == 'py':
+        if not store.is_invidx():
+            LOG.error('postings index not exists, run "full-text-index %s" first' % node)
+            sys.exit(1)
+        try:
+            cur = store.search_py(keywords)
+        except ValueError as e:
+            LOG.error(e)
+            sys.exit(1)
+    else:
+        cur = store.search(keywords)
     print_rows(cur, recover)
 
 
+def hash_cmd(node, prefix, recover=False):
+    if not HEX_PREFIX_REG.match(prefix):
+        LOG.error('%s is not a hex string' % prefix)
+        sys.exit(1)
+    store = get_node_storage(node)
+    if not store.is_hashidx():
+        LOG.error('hash index not exists, re-index the log of %s' % node)
+        sys.exit(1)
+    print_rows(store.search_hash(prefix), recover)
+
+
+def peers_cmd(node, addr=None, per_minute=False, start=None, end=None, recover=False):
+    store = get_node_storage(node)
+    if not store.is_peer_index():
+        LOG.error('peer index not exists, re-index the log of %s' % node)
+        sys.exit(1)
+    if addr and not per_minute:
+        print_rows(store.peer_logs(addr), recover)
+        return
+    for peer, minute, count, size in store.peer_traffic(addr, start, end, per_minute):
+        if per_minute:
+            print('%-21s  %s  %8d  %12d' % (peer, minute, count, size))
+        else:
+            print('%-21s  %8d  %12d' % (peer, count, size))
+
+
+def kv_cmd(node, key=None, low=None, high=None, recover=False):
+    store = get_node_storage(node)
+    if not store.is_kv_index():
+        LOG.error('key/value index not exists, re-index the log of %s' % node)
+        sys.exit(1)
+    if not key:
+        for k, count, minimum, maximum in store.kv_keys():
+            print('%-32s  %8d  %s - %s' % (k, count, minimum, maximum))
+        return
+    print_rows(store.search_kv(key, low, high), recover)
+
+
+def filter_cmd(node, expr, recover=False, count=False):
+    store = get_node_storage(node)
+    if not store.is_bitmap_index():
+        LOG.error('bitmap index not exists, re-index the log of %s' % node)
+        sys.exit(1)
+    try:
+        ids = store.filter_bitmap(expr)
+    except ValueError as e:
+        LOG.error(str(e))
+        sys.exit(1)
+    if count:
+        print(len(ids))
+    else:
+        print_rows(store.get_logs(ids), recover)
+
+
+def write_line(line):
+    sys.stdout.write((line + u'\n').encode('utf-8') if PY2 else line + '\n')
+
+
+def histogram_cmd(node, start=None, end=None, level=None, tid=None, function=None, by=None, per=None,
+                  spark=False):
+    store = get_node_storage(node)
+    if not store.is_rollup():
+        LOG.error('rollup not exists, re-index the log of %s' % node)
+        sys.exit(1)
+    stored = store.rollup_width()
+    if stored is None:
+        return
+    width = rollup.PERIODS[per] if per else stored
+    # buckets can only be merged into coarser ones
+    if width > stored:
+        LOG.error('the log of %s is counted per %s, --per %s needs re-indexing with "--rollup 1s"' % (
+            node, 'minute' if stored == rollup.GRANULARITY['1m'] else 'second', per))
+        sys.exit(1)
+    groups = {}
+    for group, bucket, count in store.histogram(width, by, start, end, level, tid, function):
+        groups.setdefault(group, {})[bucket] = count
+    if not groups:
+        return
+    if by is None and not spark:
+        buckets = rollup.fill_buckets(groups[None], width)
+        top = max(c for _, c in buckets)
+        for bucket, count in buckets:
+            write_line(u'%-19s  %8d  %s' % (bucket, count, rollup.bar(count, top)))
+        return
+    # one sparkline per group over the same buckets, shades are comparable across groups
+    every = {}
+    for counts in groups.values():
+        every.update(dict.fromkeys(counts, 0))
+    buckets = [b for b, _ in rollup.fill_buckets(every, width)]
+    top = max(c for counts in groups.values() for c in counts.values())
+    write_line(u'%-20s  %s .. %s  (max %s per %s)' % (by or '', buckets[0], buckets[-1], top,
+                                                     per or ('second' if width == 19 else 'minute')))
+    for group in sorted(groups, key=lambda g: -sum(groups[g].values())):
+        counts = groups[group]
+        line = rollup.sparkline([counts.get(b, 0) for b in buckets], top)
+        write_line(u'%-20s  %s  %d' % ('' if group is None else group, line, sum(counts.values())))
+
+
+def snapshot_cmd(at, nodes=None, recover=False):
+    """
+    node
+        tid
+            function()  [since  elapsed]  [file:line]
+    """
+    at_seconds = spans.puttime_seconds(spans.pad_puttime(at))
+    for node in nodes or sorted(indexed_nodes()):
+        store = get_node_storage(node)
+        if not store.is_span_index():
+            LOG.error('span index not exists, re-index the log of %s' % node)
+            continue
+        last_tid = None
+        for tid, depth, fun, fl, begin, end, is_open in store.active_spans(at):
+            if last_tid is None:
+                print(node)
+            if tid != last_tid:
+                print(indent_block('thread %s' % tid, 1, border=None))
+                last_tid = tid
+            fi, ln = fl.rpartition(':')[::2] if fl else ('', '')
+            if recover:
+                fun, fi, ln = recovery.recover(fun, fl)
+            print(indent_block('%s        [%s  +%.3fs%s]  [%s:%s]' % (
+                fun + '()', shorten_time(spans.seconds_puttime(begin / 1000.0)), at_seconds - begin / 1000.0,
+                ', never ended' if is_open else '', fi, ln), depth + 2))
+
+
+def first_seen(node, prefix=None, key=None, value=None, start=None, end=None):
+    """
+    runs in a thread per node, returns (node, first log) or (node, {value: first log}) in batch mode
+    """
+    store = LogStorage(node, INDEX_STORAGE)
+    if prefix is not None:
+        return node, store.first_hash(prefix) if store.is_hashidx() else None
+    if not store.is_kv_index():
+        return node, None
+    if value is not None:
+        return node, store.first_kv(key, value)
+    return node, dict((row[0], row[1:]) for row in store.first_kv_values(key, start, end))
+
+
+def propagation_cmd(nodes=None, prefix=None, block=None, key='blockNum', start=None, end=None, threads=8):
+    from multiprocessing.pool import ThreadPool
+
+    nodes = nodes or sorted(indexed_nodes())
+    unknown = set(nodes).difference(indexed_nodes())
+    if unknown:
+        LOG.error('node index not exists: ' + ' '.join(sorted(unknown)))
+        sys.exit(1)
+    if prefix is not None and not HEX_PREFIX_REG.match(prefix):
+        LOG.error('%s is not a hex string' % prefix)
+        sys.exit(1)
+    if prefix is None and block is None and not (start or end):
+        LOG.error('one of --hash, --block or a time range (batch mode) is required')
+        sys.exit(1)
+    pool = ThreadPool(min(threads, len(nodes)) or 1)
+    try:
+        seen = pool.map(partial(first_seen, prefix=prefix, key=key, value=block, start=start, end=end), nodes)
+    finally:
+        pool.close()
+
+    if prefix is not None or block is not None:
+        arrivals = sorted((row[1], node, row) for node, row in seen if row)
+        if not arrivals:
+            print('not seen by any of %s nodes' % len(nodes))
+            return
+        first = parse_puttime(arrivals[0][0])
+        spread = (parse_puttime(arrivals[-1][0]) - first).total_seconds()
+        print('%s seen by %s/%s nodes, spread %.3fs' % (
+            'hash %s' % prefix if prefix is not None else '%s %s' % (key, block), len(arrivals), len(nodes), spread))
+        for order, (puttime, node, (_, _, tid, fun)) in enumerate(arrivals, 1):
+            delay = (parse_puttime(puttime) - first).total_seconds()
+            print('%5d  %-24s  %s  +%8.3fs  %5s  %s' % (order, node, puttime, delay, tid, fun))
+        missing = sorted(node for node, row in seen if not row)
+        if missing:
+            print('not seen: ' + ' '.join(missing))
+        return
+
+    # batch mode, one line per value first seen in the time range
+    values = {}
+    for node, rows in seen:
+        for value, row in (rows or {}).items():
+            values.setdefault(value, []).append((row[1], node))
+    print('%12s  %6s  %-24s  %-23s  %9s  %9s' % (key, 'nodes', 'first node', 'first seen', 'median', 'spread'))
+    for value in sorted(values):
+        arrivals = sorted(values[value])
+        first = parse_puttime(arrivals[0][0])
+        delays = [(parse_puttime(t) - first).total_seconds() for t, _ in arrivals]
+        print('%12s  %6d  %-24s  %-23s  %8.3fs  %8.3fs' % (
+            value, len(arrivals), arrivals[0][1], arrivals[0][0], delays[len(delays) // 2], delays[-1]))
+
+
+def anomalies_cmd(nodes=None, kind=None, start=None, end=None):
+    rows = []
+    for node in nodes or sorted(indexed_nodes()):
+        store = get_node_storage(node)
+        if not store.is_events():
+            LOG.error('anomaly events not exists, re-index the log of %s' % node)
+            continue
+        rows.extend((ev_start, node, ev_kind, key, ev_end, value, baseline)
+                    for ev_kind, key, ev_start, ev_end, value, baseline in store.events(kind, start, end))
+    for ev_start, node, ev_kind, key, ev_end, value, baseline in sorted(rows):
+        if ev_kind == anomaly.GAP_EVENT:
+            detail = 'silent for %.1fs' % value
+        else:
+            detail = '%d logs/s, baseline %.1f' % (value, baseline)
+        print('%s  %s  %-24s  %-5s  %-16s  %s' % (ev_start, ev_end, node, ev_kind, key, detail))
+
+
+def window_counts(node, start, end, by):
+    """
+    (counts by function or message template, duration in seconds, first puttime, last puttime) of a time range
+    """
+    store = get_node_storage(node)
+    if not store.is_rollup():
+        LOG.error('rollup not exists, re-index the log of %s' % node)
+        sys.exit(1)
+    # whole buckets are counted, so is their duration, templates are counted over the same buckets
+    first, last = store.rollup_buckets(start, end)
+    if first is None:
+        return {}, 1.0, start, end
+    fmt, step = rollup.BUCKET_FORMATS[len(first)]
+    duration = datetime.datetime.strptime(last, fmt) + step - datetime.datetime.strptime(first, fmt)
+    if by == 'template':
+        counts = Counter(message_template(m) for m, in store.messages(start, end))
+    else:
+        counts = dict(store.rollup_counts(by, start, end))
+    return counts, duration.total_seconds(), first, last
+
+
+def diff_cmd(node, other=None, start=None, end=None, other_start=None, other_end=None, by='function',
+             threshold=3.0, top=None):
+    a, a_dur, a_first, a_last = window_counts(node, start, end, by)
+    b, b_dur, b_first, b_last = window_counts(other or node, other_start or start, other_end or end, by)
+    print('A: %s  %s .. %s  %d logs' % (node, a_first, a_last, sum(a.values())))
+    print('B: %s  %s .. %s  %d logs' % (other or node, b_first, b_last, sum(b.values())))
+    # the counts of a key are split between A and B in proportion of the durations unless its rate changed,
+    # the z-score measures how far B's share is from the expected one
+    p = a_dur / (a_dur + b_dur)
+    rows = []
+    for key in set(a).union(b):
+        ca, cb = a.get(key, 0), b.get(key, 0)
+        n = ca + cb
+        z = (cb - n * (1 - p)) / math.sqrt(n * p * (1 - p))
+        if abs(z) >= threshold:
+            change = 'new' if not ca else 'gone' if not cb else 'up' if z > 0 else 'down'
+            rows.append((-abs(z), change, key, ca, cb, z))
+    rows.sort()
+    print('%-5s  %9s  %9s  %9s  %9s  %7s  %s' % ('', 'A count', 'A /min', 'B count', 'B /min', 'z', by))
+    for _, change, key, ca, cb, z in rows[:top] if top else rows:
+        print('%-5s  %9d  %9.1f  %9d  %9.1f  %7.1f  %s' % (change, ca, ca * 60.0 / a_dur, cb, cb * 60.0 / b_dur, z, key))
+
+
+def context_cmd(node, levels=None, before=20, after=5, tid=None, recover=False):
+    store = get_node_storage(node)
+    if not store.is_bitmap_index():
+        LOG.error('bitmap index not exists, re-index the log of %s' % node)
+        sys.exit(1)
+    columns = {}
+    for t, lo, hi, anchors in store.context_windows(levels or ('WARNING', 'FATAL'), before, after, tid):
+        anchors = set(anchors)
+        rows = store.thread_logs(t, lo, hi).fetchall()
+        print('== thread %s  %s .. %s  %d logs, %d anchors' % (t, rows[0][3], rows[-1][3], len(rows), len(anchors)))
+        lines = format_rows(rows, recover, columns)
+        sys.stdout.write('\n'.join(('>> ' if row[0] in anchors else '   ') + line
+                                   for row, line in zip(rows, lines)) + '\n')
+
+
+def flamegraph_cmd(node, start=None, end=None, per_thread=False, output=None, recover=False):
+    store = get_node_storage(node)
+    names = {}
+
+    def name(fun, fl):
+        key = (fun, fl)
+        if key not in names:
+            names[key] = recovery.recover(fun, fl)[0] if recover else fun
+        return names[key]
+
+    out = open(output, 'w') if output else sys.stdout
+    try:
+        for stack, weight in spans.iter_folded(store.calls(start, end), per_thread, name):
+            out.write('%s %d\n' % (stack, weight))
+    finally:
+        if output:
+            out.close()
+
+
+TRACE_MESSAGE_MAX = 1024  # longer messages of instant events are truncated
+
+
+def trace_events(pid, node, start=None, end=None, levels=('WARNING', 'FATAL')):
+    store = get_node_storage(node)
+    if not store.is_span_index():
+        LOG.error('span index not exists, re-index the log of %s' % node)
+        return
+    first, last = store.time_range()
+    if first is None:
+        return
+    start, end = start or first, end or last
+    yield {'ph': 'M', 'name': 'process_name', 'pid': pid, 'tid': 0, 'args': {'name': node}}
+    for tid, fun, fl, begin, stop, is_open in store.spans_between(start, end):
+        args = {'fileline': fl}
+        if is_open:
+            args['never_ended'] = True
+        yield {'ph': 'X', 'cat': 'call', 'name': fun, 'pid': pid, 'tid': tid,
+               'ts': begin * 1000, 'dur': (stop - begin) * 1000, 'args': args}
+    for _, level, tid, put, fl, fun, msg in store.logs_between(start, end, levels):
+        if len(msg) > TRACE_MESSAGE_MAX:
+            msg = msg[:TRACE_MESSAGE_MAX] + '...'
+        yield {'ph': 'i', 's': 't', 'cat': level, 'name': '%s %s' % (level, fun), 'pid': pid, 'tid': tid,
+               'ts': int(round(spans.puttime_seconds(put) * 1000000)), 'args': {'message': msg, 'fileline': fl}}
+
+
+def trace_export_cmd(output, nodes=None, start=None, end=None, levels=None):
+    """
+    Chrome trace event format, one process per node, written event by event
+    """
+    count = 0
+    with open(output, 'w') as out:
+        out.write('{"displayTimeUnit": "ms", "traceEvents": [\n')
+        for pid, node in enumerate(nodes or sorted(indexed_nodes()), 1):
+            for event in trace_events(pid, node, start, end, levels or ('WARNING', 'FATAL')):
+                out.write((',\n' if count else '') + json.dumps(event))
+                count += 1
+        out.write('\n]}\n')
+    LOG.info('%s events written to %s' % (count, output))
+
+
+STATS_COLUMNS = ('count', 'mean', 'p50', 'p90', 'p99', 'max')
+
+
+def stats_cmd(nodes=None, start=None, end=None, function=None, per_node=False, sort='p99', top=None,
+              recover=False):
+    nodes = nodes or sorted(indexed_nodes())
+    sketches = {}
+    for node in nodes:
+        store = get_node_storage(node)
+        if not store.is_latency_index():
+            LOG.error('latency index not exists, re-index the log of %s' % node)
+            continue
+        for fun, fileline, blob in store.latency(start, end, function):
+            key = (node if per_node else None, fun, fileline)
+            sketch = sketches.get(key)
+            if sketch is None:
+                sketches[key] = Sketch.loads(blob)
+            else:
+                sketch.merge(Sketch.loads(blob))
+
+    def values(s):
+        return {'count': s.count, 'mean': s.mean, 'p50': s.quantile(0.5), 'p90': s.quantile(0.9),
+                'p99': s.quantile(0.99), 'max': s.max}
+
+    rows = sorted(((key, values(s)) for key, s in sketches.items()), key=lambda r: -r[1][sort])
+    if top:
+        rows = rows[:top]
+    print('%-24s%-45s  %8s' % ('node' if per_node else '', 'function', 'count') +
+          ''.join('  %9s' % c for c in STATS_COLUMNS[1:]))
+    for (node, fun, fileline), v in rows:
+        if recover:
+            fun = recovery.recover(fun, fileline)[0]
+        print('%-24s%-45s  %8d' % (node or '', fun, v['count']) +
+              ''.join('  %9.3f' % v[c] for c in STATS_COLUMNS[1:]))
+
+
+def grep_cmd(node, pattern, regex=False, ignore_case=False, recover=False):
+    store = get_node_storage(node)
+    if regex:
+        reg = re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+        literals = regex_literals(pattern)
+        match = reg.search
+    elif ignore_case:
+        literals = [[pattern.lower()]]
+        match = lambda m: literals[0][0] in m.lower()
+    else:
+        literals = [[pattern.lower()]]
+        match = lambda m: pattern in m
+    stats = {}
+    print_rows(store.grep(match, literals, stats), recover)
+    LOG.info('rows: %s  trigrams: %s  candidates: %s (%.2f%%)  matches: %s' % (
+        stats['rows'], stats['grams'], stats['candidates'],
+        100.0 * stats['candidates'] / (stats['rows'] or 1), stats['matches']))
+
+
 def callstack_cmd(node, tid, puttime, task, strict=False, show_msg=False):
     """
     BEGIN function() [xxx.cpp:123]
@@ -253,6 +759,114 @@ def callstack_cmd(node, tid, puttime, task, strict=False, show_msg=False):
             )
 
 
+@contextmanager
+def quiet():
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def bench_cmd(size=16.0, seed=0, output=None, baseline=None, tolerance=0.25, keep=False):
+    """
+    times every stage on a synthetic log, in a temp dir so the index of the current dir is untouched
+    """
+    import loggen
+    import platform
+    import shutil
+    import tempfile
+
+    tmp = tempfile.mkdtemp(prefix='zlogparser-bench-')
+    cwd = os.getcwd()
+    results = OrderedDict()
+
+    def timed(name, func, *args):
+        t = time.time()
+        with quiet():
+            func(*args)
+        results[name] = time.time() - t
+
+    try:
+        os.chdir(tmp)
+        node = 'bench'
+        path = node + '.txt'
+        with measure_time('generate %.1f Mb of logs' % size):
+            lines = loggen.generate(path, int(size * 1024 * 1024), seed)
+        store = LogStorage(node, INDEX_STORAGE)
+
+        def insert():
+            store.init()
+            store.create_log_table()
+            buf = []
+            for l in LogStream(path):
+                buf.append(l)
+                if len(buf) == 256:
+                    store.put_log_many(buf)
+                    buf = []
+            store.put_log_many(buf)
+            store.con.commit()
+
+        def secondary_index():
+            store.create_index()
+            store.create_bitmap_index()
+            store.con.commit()
+
+        def full_text_index():
+            store.create_fulltext_index_fts()
+            store.con.commit()
+
+        timed('parse', lambda: sum(1 for _ in LogStream(path)))
+        timed('insert', insert)
+        timed('secondary-index', secondary_index)
+        timed('full-text-index', full_text_index)
+        first, last = store.time_range()
+        middle = parse_puttime(first) + (parse_puttime(last) - parse_puttime(first)) / 2
+        start, end = str(middle)[:19], str(middle + datetime.timedelta(minutes=1))[:19]
+        timed('range', range_cmd, node, start, end)
+        timed('search', search_cmd, node, 'consensus round')
+        count = store.con.execute("SELECT count(*) FROM log WHERE message='BEG'").fetchone()[0]
+        tid, function, puttime = store.con.execute(
+            "SELECT tid, function, puttime FROM log WHERE message='BEG' LIMIT 1 OFFSET ?", (count // 2,)).fetchone()
+        timed('callstack', callstack_cmd, node, tid, puttime, function)
+        timed('recover', range_cmd, node, start, end, True)
+        store.con.commit()
+    finally:
+        os.chdir(cwd)
+        if keep:
+            LOG.info('bench files kept in ' + tmp)
+        else:
+            shutil.rmtree(tmp)
+
+    report = OrderedDict((
+        ('size_mb', size), ('seed', seed), ('lines', lines),
+        ('python', platform.python_version()), ('sqlite', LogStorage.sqlite_version()),
+        ('results', results),
+    ))
+    base = json.load(open(baseline))['results'] if baseline else {}
+    regressions = []
+    print('%-16s  %9s  %9s  %7s' % ('step', 'seconds', 'baseline', 'ratio'))
+    for step, seconds in results.items():
+        line = '%-16s  %9.3f' % (step, seconds)
+        if step in base:
+            ratio = seconds / base[step] if base[step] else float('inf')
+            line += '  %9.3f  %7.2f' % (base[step], ratio)
+            # tiny steps are all noise
+            if ratio > 1 + tolerance and seconds - base[step] > 0.05:
+                regressions.append(step)
+                line += '  REGRESSION'
+        print(line)
+    print('%-16s  %9.1f Mb/s' % ('parse speed', size / results['parse']))
+    if output:
+        with open(output, 'w') as fp:
+            json.dump(report, fp, indent=2)
+    if regressions:
+        LOG.error('regression of %s above %d%%' % (', '.join(regressions), tolerance * 100))
+        sys.exit(1)
+
+
 def clean():
     os.system('rm -rf ' + INDEX_STORAGE)
 
@@ -264,7 +878,22 @@ commands = {
     'query': query_cmd,
     'full-text-index': full_text_index_cmd,
     'search': search_cmd,
+    'hash': hash_cmd,
+    'peers': peers_cmd,
+    'kv': kv_cmd,
+    'histogram': histogram_cmd,
+    'stats': stats_cmd,
+    'snapshot': snapshot_cmd,
+    'flamegraph': flamegraph_cmd,
+    'trace-export': trace_export_cmd,
+    'propagation': propagation_cmd,
+    'anomalies': anomalies_cmd,
+    'diff': diff_cmd,
+    'context': context_cmd,
+    'grep': grep_cmd,
+    'filter': filter_cmd,
     'callstack': callstack_cmd,
+    'bench': bench_cmd,
     'clean': clean
 }
 
@@ -281,15 +910,54 @@ def main():
                    range START [END]
                    query NODE QUERY_STRING
                    search KEYWORD
+                   hash NODE PREFIX
+                   peers NODE [ADDR]
+                   kv NODE [KEY]
+                   histogram NODE
+                   stats [NODE...]
+                   snapshot --at TIME [NODE...]
+                   flamegraph NODE
+                   trace-export OUTPUT [NODE...]
+                   anomalies [NODE...]
+                   diff NODE [OTHER_NODE]
+                   context NODE
+                   propagation --hash PREFIX | --block NUM | --start START --end END [NODE...]
+                   grep NODE PATTERN
+                   filter NODE EXPR
                    callstack NODE TID TASK
+                   bench
+        zlogparser --profile [--profile-dir DIR] COMMAND ...
     """
     parser = argparse.ArgumentParser(prog='zlogparser', description='Zilliqa Log Analyzer')
+    parser.add_argument('--profile', dest='profile', action='store_true',
+                        help='print the time, cpu, memory, counters and cache hits of every stage to stderr, '
+                             'summed over the worker processes')
+    parser.add_argument('--profile-dir', dest='profile_dir', metavar='DIR', required=False,
+                        help='also dump the cProfile stats of every process to the dir, merged into total.prof, '
+                             'implies --profile')
     sub = parser.add_subparsers(title='commands', dest='command')
 
     # index
     cmd_index = sub.add_parser('index', description='Index log file[s] for further analysis')
     cmd_index.add_argument(
-        'file', nargs='+', help='the log Zilliqa files to index')
+        'files', metavar='file', nargs='+', help='the log Zilliqa files to index')
+    cmd_index.add_argument('-g', '--trigram', dest='trigram', action='store_true',
+                           help='also build the trigram index used by the "grep" command')
+    cmd_index.add_argument('-f', '--fts-workers', dest='fts_workers', type=int, default=1,
+                           help='build the full-text index of every file in FTS_WORKERS processes, '
+                                'each indexing a range of logs into its own segment merged at the end')
+    cmd_index.add_argument('-u', '--rollup', dest='granularity', default='1m', choices=sorted(rollup.GRANULARITY),
+                           help='the time bucket of the log counters used by the "histogram" command, '
+                                'default to 1m')
+    cmd_index.add_argument('--gap', dest='gap', type=float, default=anomaly.GAP,
+                           help='record the node silences longer than GAP seconds for the "anomalies" command, '
+                                'default to %s' % anomaly.GAP)
+    cmd_index.add_argument('-M', '--max-message', dest='max_message', type=int, default=MAX_MESSAGE,
+                           help='truncate the messages longer than MAX_MESSAGE bytes, marking the count of bytes '
+                                'dropped, 0 for no limit, default to %s' % MAX_MESSAGE)
+    cmd_index.add_argument('-b', '--memory-budget', dest='memory_budget', type=float, required=False,
+                           help='start no more files at once than their workers fit in MEMORY_BUDGET Mb, '
+                                'from the peak RSS measured, at least one file runs at a time')
 
     # ls
     cmd_list = sub.add_parser('ls', description='List items of indexed logs')
@@ -319,15 +987,230 @@ def main():
     cmd_query.add_argument('query_string', help='the query string to execute (sqlite3 WHERE clause)')
 
     # search index
-    # sub.add_parser('full-text-index', description='do full text indexing for "search" command')
+    cmd_fti = sub.add_parser('full-text-index',
+                             description='Build the compressed postings index for "search --engine py"')
+    cmd_fti.add_argument('node', help='the node to build index for')
     # search
     cmd_search = sub.add_parser('search', description='Do a full-text search over log message')
     cmd_search.add_argument('node', help='the node to search log from')
     cmd_search.add_argument('keywords', help="the keywords of the message to search, "
                                              "support '*' as wildcard, "
-                                             "support logical operator (AND|OR|NOT)")
+                                             "support logical operator (AND|OR|NOT), "
+                                             "support '\"exact phrase\"' and 'a NEAR/k b', "
+                                             "parentheses with the fts engine only")
     cmd_search.add_argument('-r', '--recover', dest='recover', action='store_true', required=False,
                             help='try to recover the full filepath and function name')
+    cmd_search.add_argument('-e', '--engine', dest='engine', default='fts', choices=('fts', 'py'),
+                            help='the full-text index to search, "py" needs the "full-text-index" command first')
+    cmd_search.add_argument('-t', '--top', dest='top', type=int, required=False,
+                            help='only print the N most relevant logs (BM25 ranking), best first')
+    cmd_search.add_argument('--recency', dest='recency', type=float, default=0.0,
+                            help='boost newer logs, the score is multiplied by (1 + RECENCY * position in log)')
+    cmd_search.add_argument('--newest', dest='newest', action='store_true',
+                            help='rank by time instead of relevance, newest first, stops after the top N matches')
+    cmd_search.add_argument('--snippet', dest='snippet', action='store_true',
+                            help='print a highlighted snippet of the message instead of the full message')
+    cmd_search.add_argument('-z', '--fuzzy', dest='fuzzy', type=int, nargs='?', const=1, default=0,
+                            help='also match indexed words within edit distance FUZZY (default 1) of every keyword')
+
+    # hash
+    cmd_hash = sub.add_parser('hash', description='Find logs containing a block hash or public key by prefix')
+    cmd_hash.add_argument('node', help='the node to search log from')
+    cmd_hash.add_argument('prefix', help='the leading hex digits of the hash or public key, "0x" is optional')
+    cmd_hash.add_argument('-r', '--recover', dest='recover', action='store_true', required=False,
+                          help='try to recover the full filepath and function name')
+
+    # peers
+    cmd_peers = sub.add_parser('peers', description='List peers and their traffic, or logs involving a peer')
+    cmd_peers.add_argument('node', help='the node to get log from')
+    cmd_peers.add_argument('addr', nargs='?', help='the peer address (ip:port), a bare ip matches all its ports. '
+                                                   'print logs involving the peer unless --per-minute')
+    cmd_peers.add_argument('-m', '--per-minute', dest='per_minute', action='store_true',
+                           help='print message count and bytes per peer per minute')
+    cmd_peers.add_argument('-s', '--start', dest='start', required=False,
+                           help='the start datetime of the traffic rollups')
+    cmd_peers.add_argument('-e', '--end', dest='end', required=False,
+                           help='the end datetime of the traffic rollups')
+    cmd_peers.add_argument('-r', '--recover', dest='recover', action='store_true', required=False,
+                           help='try to recover the full filepath and function name')
+
+    # kv
+    cmd_kv = sub.add_parser('kv', description='Query logs by the numeric "key = value" pairs of their message')
+    cmd_kv.add_argument('node', help='the node to get log from')
+    cmd_kv.add_argument('key', nargs='?', help='the key without object and "m_" prefix (e.g. blockNum), '
+                                               'list all keys if omitted')
+    cmd_kv.add_argument('-l', '--low', dest='low', type=float, required=False,
+                        help='the lower bound of the value (inclusive)')
+    cmd_kv.add_argument('-u', '--high', dest='high', type=float, required=False,
+                        help='the upper bound of the value (inclusive)')
+    cmd_kv.add_argument('-r', '--recover', dest='recover', action='store_true', required=False,
+                        help='try to recover the full filepath and function name')
+
+    # histogram
+    cmd_histogram = sub.add_parser('histogram', description='Count logs per time bucket from the rollups built '
+                                                            'while indexing')
+    cmd_histogram.add_argument('node', help='the node to count log from')
+    cmd_histogram.add_argument('-s', '--start', dest='start', required=False,
+                               help='the start datetime to count')
+    cmd_histogram.add_argument('-e', '--end', dest='end', required=False,
+                               help='the end datetime to count')
+    cmd_histogram.add_argument('-l', '--level', dest='level', required=False,
+                               help='only count logs of the level')
+    cmd_histogram.add_argument('-t', '--tid', dest='tid', type=int, required=False,
+                               help='only count logs of the thread')
+    cmd_histogram.add_argument('-f', '--function', dest='function', required=False,
+                               help='only count logs of the (truncated) function name')
+    cmd_histogram.add_argument('-b', '--by', dest='by', choices=('level', 'tid', 'function'),
+                               help='print a heatmap with one sparkline per level, tid or function')
+    cmd_histogram.add_argument('-p', '--per', dest='per', choices=('second', 'minute', 'hour', 'day'),
+                               help='the bucket size, not finer than the rollup granularity of the index, default to it')
+    cmd_histogram.add_argument('--spark', dest='spark', action='store_true',
+                               help='print a single sparkline instead of a bar per bucket')
+
+    # stats
+    cmd_stats = sub.add_parser('stats', description='Duration statistics (seconds) of the BEG/END calls per function, '
+                                                    'merged across nodes')
+    cmd_stats.add_argument('nodes', metavar='node', nargs='*', help='the nodes to get statistics from, default to all')
+    cmd_stats.add_argument('-s', '--start', dest='start', required=False,
+                           help='only count calls began after the datetime (minute precision)')
+    cmd_stats.add_argument('-e', '--end', dest='end', required=False,
+                           help='only count calls began before the datetime (minute precision)')
+    cmd_stats.add_argument('-f', '--function', dest='function', required=False,
+                           help='only the (truncated) function name')
+    cmd_stats.add_argument('-p', '--per-node', dest='per_node', action='store_true',
+                           help='one row per node and function instead of merging nodes')
+    cmd_stats.add_argument('-o', '--sort', dest='sort', default='p99', choices=STATS_COLUMNS,
+                           help='the column to sort by, descending, default to p99')
+    cmd_stats.add_argument('-t', '--top', dest='top', type=int, required=False,
+                           help='only print the first N rows')
+    cmd_stats.add_argument('-r', '--recover', dest='recover', action='store_true', required=False,
+                           help='try to recover the full function name')
+
+    # snapshot
+    cmd_snapshot = sub.add_parser('snapshot', description='Print the active call stack of every thread at an instant, '
+                                                          'looked up in the span index')
+    cmd_snapshot.add_argument('nodes', metavar='node', nargs='*', help='the nodes to get stacks from, default to all')
+    cmd_snapshot.add_argument('-a', '--at', dest='at', required=True,
+                              help='the datetime (YYYY-MM-DD HH:MM:SS.sss), a prefix such as '
+                                   '"YYYY-MM-DD HH:MM" is the start of the minute')
+    cmd_snapshot.add_argument('-r', '--recover', dest='recover', action='store_true', required=False,
+                              help='try to recover the full filepath and function name')
+
+    # flamegraph
+    cmd_flamegraph = sub.add_parser('flamegraph', description='Export the BEG/END calls as folded stacks weighted by '
+                                                              'their self time in milliseconds, '
+                                                              'the input of flamegraph.pl or speedscope')
+    cmd_flamegraph.add_argument('node', help='the node to get log from')
+    cmd_flamegraph.add_argument('-s', '--start', dest='start', required=False,
+                                help='the start datetime, calls began before are left out')
+    cmd_flamegraph.add_argument('-e', '--end', dest='end', required=False,
+                                help='the end datetime, calls ended after are left out')
+    cmd_flamegraph.add_argument('-t', '--per-thread', dest='per_thread', action='store_true',
+                                help='put the thread ID at the root of every stack')
+    cmd_flamegraph.add_argument('-o', '--output', dest='output', required=False,
+                                help='the file to write, default to stdout')
+    cmd_flamegraph.add_argument('-r', '--recover', dest='recover', action='store_true', required=False,
+                                help='try to recover the full function name')
+
+    # trace-export
+    cmd_trace = sub.add_parser('trace-export', description='Export the calls of several nodes to a Chrome trace event '
+                                                           'JSON file, to view them side by side in chrome://tracing '
+                                                           'or Perfetto')
+    cmd_trace.add_argument('output', help='the JSON file to write')
+    cmd_trace.add_argument('nodes', metavar='node', nargs='*', help='the nodes to export, default to all')
+    cmd_trace.add_argument('-s', '--start', dest='start', required=False,
+                           help='the start datetime, default to the first log of every node')
+    cmd_trace.add_argument('-e', '--end', dest='end', required=False,
+                           help='the end datetime, default to the last log of every node')
+    cmd_trace.add_argument('-l', '--level', dest='levels', action='append',
+                           help='the log level exported as instant events, can be repeated, '
+                                'default to WARNING and FATAL')
+
+    # propagation
+    cmd_propagation = sub.add_parser('propagation', description='Trace when a block reached every node, from the hash '
+                                                                'and key/value indexes of the nodes')
+    cmd_propagation.add_argument('nodes', metavar='node', nargs='*', help='the nodes to compare, default to all')
+    cmd_propagation.add_argument('-x', '--hash', dest='prefix', required=False,
+                                 help='the block hash (or its leading hex digits) to trace')
+    cmd_propagation.add_argument('-b', '--block', dest='block', type=int, required=False,
+                                 help='the block number to trace')
+    cmd_propagation.add_argument('-k', '--key', dest='key', default='blockNum',
+                                 help='the key of the block number in the messages, default to blockNum')
+    cmd_propagation.add_argument('-s', '--start', dest='start', required=False,
+                                 help='batch mode: trace every block number first seen after the datetime')
+    cmd_propagation.add_argument('-e', '--end', dest='end', required=False,
+                                 help='batch mode: trace every block number first seen before the datetime')
+    cmd_propagation.add_argument('-j', '--threads', dest='threads', type=int, default=8,
+                                 help='the number of nodes read in parallel, default to 8')
+
+    # anomalies
+    cmd_anomalies = sub.add_parser('anomalies', description='List the silences and log rate spikes found while '
+                                                            'indexing, of the node, its levels and threads')
+    cmd_anomalies.add_argument('nodes', metavar='node', nargs='*', help='the nodes to list, default to all')
+    cmd_anomalies.add_argument('-k', '--kind', dest='kind', choices=(anomaly.GAP_EVENT, anomaly.SPIKE_EVENT),
+                               help='only list gaps or spikes')
+    cmd_anomalies.add_argument('-s', '--start', dest='start', required=False,
+                               help='the start datetime of the events')
+    cmd_anomalies.add_argument('-e', '--end', dest='end', required=False,
+                               help='the end datetime of the events')
+
+    # diff
+    cmd_diff = sub.add_parser('diff', description='Compare two nodes, or two time ranges, by the rate of every '
+                                                  'function or message template, and print the significant changes')
+    cmd_diff.add_argument('node', help='the node of selection A')
+    cmd_diff.add_argument('other', nargs='?', help='the node of selection B, default to the node of A')
+    cmd_diff.add_argument('-s', '--start', dest='start', required=False, help='the start datetime of A')
+    cmd_diff.add_argument('-e', '--end', dest='end', required=False, help='the end datetime of A')
+    cmd_diff.add_argument('-S', '--other-start', dest='other_start', required=False,
+                          help='the start datetime of B, default to the start of A')
+    cmd_diff.add_argument('-E', '--other-end', dest='other_end', required=False,
+                          help='the end datetime of B, default to the end of A')
+    cmd_diff.add_argument('-b', '--by', dest='by', default='function', choices=('function', 'level', 'tid', 'template'),
+                          help='compare the counts of function, level or tid from the rollups, or of the message '
+                               'templates (numbers, hex strings and addresses masked) by reading the messages, '
+                               'default to function')
+    cmd_diff.add_argument('-z', '--threshold', dest='threshold', type=float, default=3.0,
+                          help='only print the changes with a z-score above THRESHOLD, default to 3')
+    cmd_diff.add_argument('-t', '--top', dest='top', type=int, required=False,
+                          help='only print the N most significant changes')
+
+    # context
+    cmd_context = sub.add_parser('context', description='Print the logs of the same thread around every log of a level, '
+                                                        'overlapping windows are merged')
+    cmd_context.add_argument('node', help='the node to get log from')
+    cmd_context.add_argument('-l', '--level', dest='levels', action='append',
+                             help='the level of the anchor logs, can be repeated, default to WARNING and FATAL')
+    cmd_context.add_argument('-B', '--before', dest='before', type=int, default=20,
+                             help='the number of logs of the thread printed before every anchor, default to 20')
+    cmd_context.add_argument('-A', '--after', dest='after', type=int, default=5,
+                             help='the number of logs of the thread printed after every anchor, default to 5')
+    cmd_context.add_argument('-t', '--tid', dest='tid', type=int, required=False,
+                             help='only the anchors of the thread')
+    cmd_context.add_argument('-r', '--recover', dest='recover', action='store_true', required=False,
+                             help='try to recover the full filepath and function name')
+
+    # grep
+    cmd_grep = sub.add_parser('grep', description='Find logs whose message contains a substring or matches a regex, '
+                                                  'narrowed down by the trigram index ("index --trigram")')
+    cmd_grep.add_argument('node', help='the node to search log from')
+    cmd_grep.add_argument('pattern', help='the substring (or regex with -E) to search')
+    cmd_grep.add_argument('-E', '--regex', dest='regex', action='store_true',
+                          help='the pattern is a python regex')
+    cmd_grep.add_argument('-i', '--ignore-case', dest='ignore_case', action='store_true',
+                          help='case-insensitive match')
+    cmd_grep.add_argument('-r', '--recover', dest='recover', action='store_true', required=False,
+                          help='try to recover the full filepath and function name')
+
+    # filter
+    cmd_filter = sub.add_parser('filter', description='Filter logs by fields and keywords, evaluated on bitmap indexes')
+    cmd_filter.add_argument('node', help='the node to get log from')
+    cmd_filter.add_argument('expr', help='operands are level=X, tid=X, function=X or full-text keywords '
+                                         '(quote phrases), combined by AND (implicit), OR, NOT and parentheses, '
+                                         'e.g. \'level=WARNING tid=123 NOT "state delta"\'')
+    cmd_filter.add_argument('-c', '--count', dest='count', action='store_true',
+                            help='only print the number of matching logs')
+    cmd_filter.add_argument('-r', '--recover', dest='recover', action='store_true', required=False,
+                            help='try to recover the full filepath and function name')
 
     # callstack
     cmd_callstack = sub.add_parser('callstack', description='Get callstack of particular task')
@@ -341,22 +1224,41 @@ def main():
     cmd_callstack.add_argument('-m', '--show-msg', dest='show_msg', action='store_true',
                                help='show log message in printed stack')
 
+    # bench
+    cmd_bench = sub.add_parser('bench', description='Time parsing, indexing and queries on a synthetic log, '
+                                                    'and compare with a baseline')
+    cmd_bench.add_argument('-m', '--size', dest='size', type=float, default=16.0,
+                           help='the size of the synthetic log in Mb, default to 16')
+    cmd_bench.add_argument('--seed', dest='seed', type=int, default=0,
+                           help='the seed of the synthetic log, default to 0')
+    cmd_bench.add_argument('-o', '--output', dest='output', required=False,
+                           help='write the results to a JSON file')
+    cmd_bench.add_argument('-b', '--baseline', dest='baseline', required=False,
+                           help='the JSON results of a previous run to compare with, '
+                                'exit with 1 if a step got slower than the tolerance')
+    cmd_bench.add_argument('-t', '--tolerance', dest='tolerance', type=float, default=0.25,
+                           help='the allowed slowdown ratio of a step, default to 0.25')
+    cmd_bench.add_argument('-k', '--keep', dest='keep', action='store_true',
+                           help='keep the synthetic log and its index')
+
     sub.add_parser('clean', description='do full text indexing for "search" command')
 
     kwargs = vars(parser.parse_args())
     # LOG.info(kwargs)
 
     command = kwargs.pop('command')
+    profile = kwargs.pop('profile')
+    profile_dir = kwargs.pop('profile_dir')
     if not command:
         parser.print_usage()
         print('zlogparser: error: too few arguments')
         sys.exit(2)
     func = commands[command]
     try:
-        if command == 'index':
-            return func(*kwargs['file'])
-        else:
-            return func(**kwargs)
+        if profile or profile_dir:
+            with profiling.Session(profile_dir):
+                return func(**kwargs)
+        return func(**kwargs)
     except KeyboardInterrupt:
         print('abort')
         sys.exit(1)
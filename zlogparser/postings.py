@@ -0,0 +1,347 @@
+"""
+Compressed postings lists stored in sqlite.
+
+Every term is stored as a single row holding the sorted ids of the logs it
+appears in, the ids are delta encoded and packed as varints.
+Optionally the positions of the term in every log are kept as well, as a
+count followed by the delta encoded positions for each id.
+Terms are accumulated in memory in bounded chunks, every chunk is flushed as a
+sorted run into a temp table and all runs are merged into the final table at
+the end.
+"""
+from __future__ import print_function
+
+import heapq
+import logging
+import sqlite3
+
+try:
+    from itertools import izip
+except ImportError:
+    izip = zip
+
+LOG = logging.getLogger()
+
+SQL_CREATE_TABLE_POSTINGS = '''
+CREATE TABLE IF NOT EXISTS {table} (
+    word TEXT    NOT NULL PRIMARY KEY,
+    df   INTEGER NOT NULL,
+    ids  BLOB    NOT NULL,
+    pos  BLOB
+)
+'''
+
+SQL_CREATE_TABLE_RUNS = '''
+CREATE TEMP TABLE IF NOT EXISTS {table}_run (
+    run  INTEGER NOT NULL,
+    word TEXT    NOT NULL,
+    ids  BLOB    NOT NULL,
+    pos  BLOB,
+    PRIMARY KEY (run, word)
+)
+'''
+
+CHUNK_SIZE = 1 << 20  # max postings kept in memory before flushing a run
+
+
+def encode_ids(ids):
+    """
+    delta + varint encode a sorted sequence of ids
+    """
+    buf = bytearray()
+    last = 0
+    for i in ids:
+        d = i - last
+        last = i
+        while d > 0x7f:
+            buf.append((d & 0x7f) | 0x80)
+            d >>= 7
+        buf.append(d)
+    return buf
+
+
+def decode_ids(blob):
+    """
+    decode a blob made by encode_ids, yields the ids in order
+    """
+    last = n = shift = 0
+    for b in bytearray(blob):
+        n |= (b & 0x7f) << shift
+        if b & 0x80:
+            shift += 7
+        else:
+            last += n
+            yield last
+            n = shift = 0
+
+
+def encode_positions(buf, positions):
+    """
+    append the count and the delta encoded positions of a log to buf
+    """
+    n = len(positions)
+    while n > 0x7f:
+        buf.append((n & 0x7f) | 0x80)
+        n >>= 7
+    buf.append(n)
+    buf.extend(encode_ids(positions))
+
+
+def decode_varints(blob):
+    n = shift = 0
+    for b in bytearray(blob):
+        n |= (b & 0x7f) << shift
+        if b & 0x80:
+            shift += 7
+        else:
+            yield n
+            n = shift = 0
+
+
+def decode_positions(blob):
+    """
+    decode a blob made of encode_positions, yields the position list of every id
+    """
+    it = decode_varints(blob)
+    for count in it:
+        last = 0
+        positions = []
+        for _ in range(count):
+            last += next(it)
+            positions.append(last)
+        yield positions
+
+
+def intersect(streams):
+    """
+    intersect sorted id streams, pass the shortest stream first for best speed.
+    """
+    iters = [iter(s) for s in streams]
+    if not iters:
+        return
+    try:
+        current = [next(i) for i in iters]
+        while True:
+            hi = max(current)
+            matched = True
+            for n, it in enumerate(iters):
+                v = current[n]
+                while v < hi:
+                    v = next(it)
+                current[n] = v
+                if v != hi:
+                    matched = False
+            if matched:
+                yield hi
+                current = [next(i) for i in iters]
+    except StopIteration:
+        return
+
+
+def union(streams):
+    last = None
+    for i in heapq.merge(*streams):
+        if i != last:
+            yield i
+            last = i
+
+
+def difference(stream, excluded):
+    excluded = iter(excluded)
+    ex = next(excluded, None)
+    for i in stream:
+        while ex is not None and ex < i:
+            ex = next(excluded, None)
+        if ex != i:
+            yield i
+
+
+class PostingsWriter(object):
+    def __init__(self, con, table='invidx', chunk_size=CHUNK_SIZE, positions=False):
+        self.con = con
+        self.table = table
+        self.chunk_size = chunk_size
+        self.positions = positions
+        self._terms = {}
+        self._pos = {}
+        self._size = 0
+        self._runs = 0
+        self.con.execute(SQL_CREATE_TABLE_POSTINGS.format(table=table))
+        self.con.execute(SQL_CREATE_TABLE_RUNS.format(table=table))
+
+    def add(self, doc_id, terms):
+        """
+        add the terms of a document, documents must be added in ascending id order.
+        with positions, terms is a dict of term -> sorted positions and a document is added once,
+        otherwise adding a document again keeps its ids once.
+        """
+        for t in terms:
+            ids = self._terms.get(t)
+            if ids is None:
+                self._terms[t] = [doc_id]
+            elif ids[-1] != doc_id:
+                ids.append(doc_id)
+        if self.positions:
+            for t, positions in terms.items():
+                buf = self._pos.get(t)
+                if buf is None:
+                    buf = self._pos[t] = bytearray()
+                encode_positions(buf, positions)
+        self._size += len(terms)
+        if self._size >= self.chunk_size:
+            self.flush()
+
+    def _chunk(self):
+        for w, ids in sorted(self._terms.items()):
+            pos = self._pos.get(w)
+            yield w, ids, sqlite3.Binary(pos) if pos is not None else None
+
+    def flush(self):
+        if not self._terms:
+            return
+        self.con.executemany(
+            'INSERT INTO {t}_run (run, word, ids, pos) VALUES (?, ?, ?, ?)'.format(t=self.table),
+            ((self._runs, w, sqlite3.Binary(encode_ids(ids)), pos) for w, ids, pos in self._chunk())
+        )
+        LOG.debug('flushed run %s of %s postings' % (self._runs, self._size))
+        self._runs += 1
+        self._terms = {}
+        self._pos = {}
+        self._size = 0
+
+    def _iter_run(self, run):
+        cur = self.con.execute(
+            'SELECT word, ids, pos FROM {t}_run WHERE run=? ORDER BY word'.format(t=self.table), (run,))
+        for word, ids, pos in cur:
+            yield word, run, ids, pos
+
+    def _merged(self):
+        # runs hold increasing id ranges, so the lists of a term are concatenated in run order,
+        # positions are kept per id and are concatenated as is
+        def row():
+            return word, len(ids), sqlite3.Binary(encode_ids(ids)), sqlite3.Binary(pos) if self.positions else None
+
+        word, ids, pos = None, [], bytearray()
+        for w, _, blob, pos_blob in heapq.merge(*[self._iter_run(r) for r in range(self._runs)]):
+            if w != word:
+                if ids:
+                    yield row()
+                word, ids, pos = w, [], bytearray()
+            run_ids = decode_ids(blob)
+            if ids:
+                # a document added again after a flush starts the next run
+                first = next(run_ids)
+                if first != ids[-1]:
+                    ids.append(first)
+            ids.extend(run_ids)
+            if pos_blob is not None:
+                pos.extend(bytearray(pos_blob))
+        if ids:
+            yield row()
+
+    def close(self):
+        if self._runs == 0:
+            # single chunk, no need to go through the run table
+            self.con.executemany(
+                'INSERT INTO {t} (word, df, ids, pos) VALUES (?, ?, ?, ?)'.format(t=self.table),
+                ((w, len(ids), sqlite3.Binary(encode_ids(ids)), pos) for w, ids, pos in self._chunk())
+            )
+            self._terms = {}
+            self._pos = {}
+        else:
+            self.flush()
+            self.con.executemany('INSERT INTO {t} (word, df, ids, pos) VALUES (?, ?, ?, ?)'.format(t=self.table),
+                                 self._merged())
+            self.con.execute('DELETE FROM {t}_run'.format(t=self.table))
+        self.con.commit()
+
+
+class PostingsReader(object):
+    def __init__(self, con, table='invidx'):
+        self.con = con
+        self.table = table
+
+    def df(self, word):
+        row = self.con.execute('SELECT df FROM {t} WHERE word=?'.format(t=self.table), (word,)).fetchone()
+        return row[0] if row else 0
+
+    def postings(self, word):
+        row = self.con.execute('SELECT ids FROM {t} WHERE word=?'.format(t=self.table), (word,)).fetchone()
+        return decode_ids(row[0]) if row else iter(())
+
+    def positions(self, word):
+        """
+        yields (id, positions) of the word, needs an index written with positions
+        """
+        row = self.con.execute('SELECT ids, pos FROM {t} WHERE word=?'.format(t=self.table), (word,)).fetchone()
+        if not row or row[1] is None:
+            return iter(())
+        return izip(decode_ids(row[0]), decode_positions(row[1]))
+
+    def all_of(self, words):
+        words = set(words)
+        if not words:
+            return iter(())
+        rows = self.con.execute(
+            'SELECT df, ids FROM {t} WHERE word IN ({q})'.format(t=self.table, q=','.join('?' * len(words))),
+            tuple(words)
+        ).fetchall()
+        if len(rows) < len(words):
+            return iter(())
+        return intersect(decode_ids(ids) for _, ids in sorted(rows))
+
+    def any_of(self, words):
+        return union([self.postings(w) for w in set(words)])
+
+
+def _bench(logfile):
+    """
+    compare build time, disk size and query latency of the postings index with the FTS4 index
+    """
+    import os
+    import shutil
+    import tempfile
+    import time
+    from preprocess import LogStream
+    from storage import LogStorage
+
+    tmp = tempfile.mkdtemp()
+    try:
+        stream = LogStream(logfile)
+        base = LogStorage(stream.node, tmp)
+        base.init()
+        base.create_log_table()
+        base.put_log_many(stream)
+        base.con.commit()
+        base_size = os.stat(base.path).st_size
+        stores = {}
+        for engine in ('fts', 'py'):
+            path = os.path.join(tmp, engine)
+            os.makedirs(path)
+            shutil.copy(base.path, path)
+            store = stores[engine] = LogStorage(stream.node, path)
+            store.init()
+            t = time.time()
+            if engine == 'fts':
+                store.create_fulltext_index_fts()
+            else:
+                store.create_fulltext_index_py()
+            store.con.commit()
+            build = time.time() - t
+            store.con.execute('VACUUM')
+            size = os.stat(store.path).st_size - base_size
+            print('%-4s build: %8.2f sec  size: %8.1f Mb' % (engine, build, size / 1024.0 / 1024))
+        for q in ('epoch', 'state delta', 'incoming broadcast', 'blockhash'):
+            for engine in ('fts', 'py'):
+                search = stores[engine].search if engine == 'fts' else stores[engine].search_py
+                t = time.time()
+                count = sum(1 for _ in search(q))
+                print('%-4s query: %-20r %8.2f ms  hits: %s' % (engine, q, (time.time() - t) * 1000, count))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    import sys
+
+    _bench(sys.argv[1] if len(sys.argv) > 1 else 'logs/community-lookup-0.txt')
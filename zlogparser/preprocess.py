@@ -34,6 +34,11 @@ FATAL = 'FATAL'
 # )
 
 
+# bytes of a message kept, the continuation lines beyond are dropped and counted in a marker,
+# so that a huge multi-line dump can't grow the memory of the parser
+MAX_MESSAGE = 1 << 20
+TRUNCATED_MARK = '\n... [truncated %d bytes]'
+
 LOG_FIELDS = [
     ('level', None),
     ('tid', lambda x: int(x)),
@@ -46,12 +51,18 @@ LOG_FIELDS = [
 
 
 class LogStream(object):
-    def __init__(self, filename):
+    def __init__(self, filename, max_message=MAX_MESSAGE):
         self.filename = filename
         self.node = os.path.split(filename)[-1].rpartition('.')[0]
         self._fp = None
+        if max_message < 0:
+            raise ValueError('max_message must be >= 0, got %s' % max_message)
+        self.max_message = max_message or float('inf')
+        self.truncated = 0  # number of truncated messages
         self._msg_pending = False
         self._msg_buf = []
+        self._msg_size = 0
+        self._msg_dropped = 0
         self._log_buf = []
         self.open()
 
@@ -67,17 +78,32 @@ class LogStream(object):
         self._fp.close()
 
     def __del__(self):
-        self._fp.close()
+        if self._fp:
+            self._fp.close()
+
+    def tell(self):
+        """
+        bytes read so far, ahead of the yielded logs by the read buffer
+        """
+        return self._fp.tell()
+
+    def _message(self):
+        msg = '\n'.join(self._msg_buf)
+        if self._msg_dropped:
+            msg += TRUNCATED_MARK % self._msg_dropped
+            self.truncated += 1
+            self._msg_dropped = 0
+        return msg
 
     def __iter__(self):
+        max_message = self.max_message
         for line in self._fp:
             if not line:
                 continue
             if line[0] == '[':
                 if self._log_buf:
-                    msg = '\n'.join(self._msg_buf)
                     log = self._log_buf
-                    log.append(msg)
+                    log.append(self._message())
                     self._log_buf = []
                     self._msg_buf = []
                     self._msg_pending = False
@@ -94,11 +120,16 @@ class LogStream(object):
                         except Exception as e:
                             self._log_buf = []
                             self._msg_buf = []
+                            self._msg_dropped = 0
                             self._msg_pending = False
                             LOG.error("Error: %s\n" % e + "Unparsed line: " + line)
                             continue
                     if name == 'msg':
+                        if len(f) > max_message:
+                            self._msg_dropped = len(f) - max_message
+                            f = f[:max_message]
                         self._msg_buf = [f]
+                        self._msg_size = len(f)
                     else:
                         self._log_buf.append(f)
                 self._msg_pending = True
@@ -106,9 +137,15 @@ class LogStream(object):
                 if not self._log_buf or not self._msg_pending:
                     LOG.error("Unparsed line: " + line)
                     continue
+                # counting the '\n' of the join. once a line is dropped, the rest of the message is
+                # dropped too, so that the kept part is never spliced around a gap
+                if self._msg_dropped or self._msg_size + len(line) + 1 > max_message:
+                    self._msg_dropped += len(line) + 1
+                    continue
+                self._msg_size += len(line) + 1
                 self._msg_buf.append(line)
         if self._log_buf:
-            self._log_buf.append('\n'.join(self._msg_buf))
+            self._log_buf.append(self._message())
             yield self._log_buf
 
 
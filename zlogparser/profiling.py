@@ -0,0 +1,208 @@
+"""
+Counters and timings of the pipeline stages, collected when running with --profile.
+
+Every process keeps its own numbers: the stages timed by measure_time (wall
+and cpu seconds), named counters incremented once per batch, the cache
+statistics and the peak RSS. Worker processes send a snapshot back to the
+parent, where the snapshots are summed into one report. With a profile dir
+every process also dumps its cProfile stats there, and the parent merges them.
+"""
+from __future__ import print_function
+
+import glob
+import os
+import sys
+import time
+from collections import Counter
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+enabled = False
+output_dir = None
+
+stages = OrderedDict()  # name -> [calls, wall seconds, cpu seconds]
+counters = Counter()
+workers = {}  # summed snapshots of the worker processes
+# cpu time and cache statistics when the collection started, a pool worker may run several tasks
+_baseline = {}
+
+
+def cpu_time():
+    t = os.times()
+    return t[0] + t[1]
+
+
+def max_rss():
+    """
+    peak resident set size of the process in Mb
+    """
+    if resource is None:
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024.0 / (1024 if sys.platform == 'darwin' else 1)
+
+
+def record_stage(name, wall, cpu):
+    stage = stages.get(name)
+    if stage is None:
+        stage = stages[name] = [0, 0.0, 0.0]
+    stage[0] += 1
+    stage[1] += wall
+    stage[2] += cpu
+
+
+def count(name, n=1):
+    if enabled:
+        counters[name] += n
+
+
+def _caches():
+    import recovery
+    from tokenizer import stem_cache
+    from tokenizer import stm
+
+    info = stm.stem.cache_info()
+    return OrderedDict((
+        ('recovery', (recovery.stats['hits'], recovery.stats['misses'], len(recovery.cache))),
+        ('stem lru_cache', (info.hits, info.misses, info.currsize)),
+        ('stem cache', (None, stem_cache.misses, len(stem_cache.cache))),
+    ))
+
+
+def snapshot():
+    """
+    the numbers of this process, summable with merge()
+    """
+    caches = OrderedDict()
+    for name, (hits, misses, size) in _caches().items():
+        h, m, _ = _baseline[name]
+        caches[name] = (None if hits is None else hits - h, misses - m, size)
+    return {
+        'tasks': 1,
+        'stages': [(name, s[0], s[1], s[2]) for name, s in stages.items()],
+        'counters': dict(counters),
+        'caches': caches,
+        'cpu': cpu_time() - _baseline.get('cpu', 0),
+        'rss': {os.getpid(): max_rss()},
+    }
+
+
+def merge(total, other):
+    if not total:
+        total.update(other)
+        total['stages'] = list(other['stages'])
+        total['caches'] = OrderedDict(other['caches'])
+        total['rss'] = dict(other['rss'])
+        return total
+    order = [name for name, _, _, _ in total['stages']]
+    summed = dict((name, [c, w, u]) for name, c, w, u in total['stages'])
+    for name, c, w, u in other['stages']:
+        if name not in summed:
+            order.append(name)
+            summed[name] = [0, 0.0, 0.0]
+        summed[name][0] += c
+        summed[name][1] += w
+        summed[name][2] += u
+    total['stages'] = [(name,) + tuple(summed[name]) for name in order]
+    total['counters'] = dict(Counter(total['counters']) + Counter(other['counters']))
+    for name, (hits, misses, size) in other['caches'].items():
+        h, m, s = total['caches'].get(name, (0, 0, 0))
+        total['caches'][name] = (None if hits is None else (h or 0) + hits, m + misses, s + size)
+    total['tasks'] += other['tasks']
+    total['cpu'] += other['cpu']
+    for pid, rss in other['rss'].items():
+        total['rss'][pid] = max(rss, total['rss'].get(pid, 0))
+    return total
+
+
+def start(profile_dir=None):
+    """
+    enable the collection in this process, returns the cProfile profiler if profile_dir
+    """
+    global enabled, output_dir
+    enabled = True
+    output_dir = profile_dir
+    stages.clear()
+    counters.clear()
+    _baseline.clear()
+    _baseline.update(_caches())
+    _baseline['cpu'] = cpu_time()
+    if not profile_dir:
+        return None
+    import cProfile
+    if not os.path.isdir(profile_dir):
+        os.makedirs(profile_dir)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def add(snap):
+    """
+    add the snapshot of a worker process to the report
+    """
+    if snap:
+        merge(workers, snap)
+
+
+def stop(profiler, name):
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(os.path.join(output_dir, '%s.%s.prof' % (name, os.getpid())))
+
+
+def report(total, wall, since=0, out=sys.stderr):
+    """
+    print the summed numbers of every process, and merge the cProfile dumps written since then if any
+    """
+    w = out.write
+    w('\nprofile: %d task(s) in %d process(es), wall %.2f sec, cpu %.2f sec, peak rss %.1f Mb (summed)\n' % (
+        total['tasks'], len(total['rss']), wall, total['cpu'], sum(total['rss'].values())))
+    if total['stages']:
+        w('%-32s %6s %10s %10s\n' % ('stage', 'calls', 'wall sec', 'cpu sec'))
+        for name, calls, wall_sec, cpu_sec in total['stages']:
+            w('%-32s %6d %10.2f %10.2f\n' % (name, calls, wall_sec, cpu_sec))
+    if total['counters']:
+        w('%-32s %16s\n' % ('counter', 'value'))
+        for name, value in sorted(total['counters'].items()):
+            w('%-32s %16d\n' % (name, value))
+    w('%-32s %10s %10s %10s\n' % ('cache', 'hits', 'misses', 'size'))
+    for name, (hits, misses, size) in total['caches'].items():
+        w('%-32s %10s %10d %10d\n' % (name, '-' if hits is None else hits, misses, size))
+    if output_dir:
+        import pstats
+        dumps = sorted(glob.glob(os.path.join(output_dir, '*.prof')))
+        dumps = [d for d in dumps if not d.endswith('total.prof') and os.path.getmtime(d) >= since]
+        if dumps:
+            stats = pstats.Stats(dumps[0], stream=out)
+            for d in dumps[1:]:
+                stats.add(d)
+            stats.dump_stats(os.path.join(output_dir, 'total.prof'))
+            w('\ncProfile of %d process(es), merged into %s\n' % (len(dumps), os.path.join(output_dir, 'total.prof')))
+            stats.sort_stats('cumulative').print_stats(20)
+
+
+class Session(object):
+    """
+    collects the numbers of a command run in the main process and reports them with the workers ones
+    """
+
+    def __init__(self, profile_dir=None):
+        self.profile_dir = profile_dir
+
+    def __enter__(self):
+        self.t = time.time()
+        workers.clear()
+        self.profiler = start(self.profile_dir)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        stop(self.profiler, 'main')
+        total = merge({}, snapshot())
+        if workers:
+            merge(total, workers)
+        report(total, time.time() - self.t, int(self.t))
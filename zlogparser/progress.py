@@ -0,0 +1,198 @@
+"""
+Live progress of the log files indexed by the pool workers.
+
+The parent allocates a shared array of doubles, a few per file, and hands it to
+the workers by the pool initializer. A worker writes the bytes read and the
+records parsed of its file once per insert batch, without any lock: every
+slot has a single writer, and a slightly stale value is fine for a display.
+The parent polls the array and renders one status line on stderr with the
+overall throughput, the ETA and the slowest files. The ETA also counts the
+index building after the parsing, by the share of the parsing time in the
+files already done.
+
+The workers also report their peak RSS, which the parent uses to start no
+more files at once than a memory budget allows.
+"""
+from __future__ import print_function
+
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from datetime import timedelta
+
+from profiling import max_rss
+
+# the fields of every file in the shared array
+BYTES, RECORDS, STATE, STARTED, INDEXED, FINISHED, RSS = range(7)
+FIELDS = 7
+
+PENDING, INSERTING, INDEXING, DONE = range(4)
+
+INTERVAL = 0.5  # seconds between two renderings on a terminal
+LOG_INTERVAL = 10.0  # seconds between two lines when stderr is not a terminal
+SLOWEST = 3
+POLL = 0.05  # seconds between two checks of the memory budget
+
+LOG = logging.getLogger()
+
+_shared = None  # (file -> offset in the array, array) in a worker
+
+
+def init_worker(files, array, quiet=False):
+    """
+    pool initializer, gives the shared array to the worker.
+    quiet workers only log warnings, so that their lines don't break the status line on a terminal
+    """
+    global _shared
+    _shared = (dict((f, i * FIELDS) for i, f in enumerate(files)), array)
+    if quiet:
+        logger = logging.getLogger()
+        logger.setLevel(max(logger.level, logging.WARNING))
+
+
+class FileProgress(object):
+    """
+    the worker side of the progress of a file, does nothing outside of an indexing pool
+    """
+
+    def __init__(self, filepath):
+        self.array = None
+        if _shared is not None and filepath in _shared[0]:
+            self.offset, self.array = _shared[0][filepath], _shared[1]
+
+    def update(self, size, records):
+        if self.array is not None:
+            self.array[self.offset + BYTES] = size
+            self.array[self.offset + RECORDS] = records
+            self.array[self.offset + RSS] = max_rss()
+
+    def state(self, state):
+        if self.array is None:
+            return
+        self.array[self.offset + (STARTED, INDEXED, FINISHED)[state - INSERTING]] = time.time()
+        self.array[self.offset + RSS] = max_rss()
+        self.array[self.offset + STATE] = state
+
+
+def _size(n):
+    if n >= 1 << 30:
+        return '%.1f Gb' % (n / float(1 << 30))
+    return '%.1f Mb' % (n / float(1 << 20))
+
+
+class Progress(object):
+    """
+    the parent side, renders the progress of the files until the async result of the pool is ready
+    """
+
+    def __init__(self, files, out=sys.stderr):
+        self.files = list(files)
+        self.names = [os.path.basename(f).rpartition('.')[0] for f in self.files]
+        self.sizes = [os.stat(f).st_size for f in self.files]
+        self.total = float(sum(self.sizes)) or 1.0
+        self.array = multiprocessing.Array('d', len(self.files) * FIELDS, lock=False)
+        self.out = out
+        self.tty = out.isatty()
+        self.width = 0
+
+    @property
+    def initargs(self):
+        # an explicit LOG_LEVEL keeps the logs of the workers
+        return self.files, self.array, self.tty and not os.getenv('LOG_LEVEL')
+
+    def status(self, now):
+        """
+        the status line of the files
+        """
+        a = self.array
+        read = indexed = records = 0
+        parsing = building = 0.0
+        states = [0] * 4
+        rates = []
+        for i, size in enumerate(self.sizes):
+            o = i * FIELDS
+            state = int(a[o + STATE])
+            states[state] += 1
+            done = size if state >= INDEXING else min(a[o + BYTES], size)
+            read += done
+            records += a[o + RECORDS]
+            if state == INSERTING and now > a[o + STARTED]:
+                rates.append((done / (now - a[o + STARTED]), self.names[i]))
+            elif state == DONE:
+                indexed += size
+                # files already indexed or failed before the index building have no timings
+                if a[o + STARTED] and a[o + INDEXED]:
+                    parsing += a[o + INDEXED] - a[o + STARTED]
+                    building += a[o + FINISHED] - a[o + INDEXED]
+        elapsed = now - self.t
+        speed = read / elapsed if elapsed > 0 else 0.0
+        share = parsing / (parsing + building) if parsing + building > 0 else 0.5
+        work = share * read + (1 - share) * indexed
+        eta = str(timedelta(seconds=int(elapsed * (self.total - work) / work))) if work else '?'
+        line = '[%5.1f%%] %s/%s  %.1f Mb/s  %d logs  ETA %s  files: %d done, %d indexing, %d parsing, %d pending' % (
+            100 * work / self.total, _size(read), _size(self.total), speed / (1 << 20), records, eta,
+            states[DONE], states[INDEXING], states[INSERTING], states[PENDING])
+        if rates:
+            line += '  slowest: ' + ', '.join('%s %.1f Mb/s' % (name, rate / (1 << 20))
+                                              for rate, name in sorted(rates)[:SLOWEST])
+        return line
+
+    def render(self, now, final=False):
+        line = self.status(now)
+        if self.tty:
+            # pad with spaces to erase the end of a longer previous line
+            self.out.write('\r' + line.ljust(self.width) + ('\n' if final else ''))
+            self.width = len(line)
+        else:
+            self.out.write(line + '\n')
+        self.out.flush()
+
+    def wait(self, result):
+        """
+        render until the async result is ready, returns its value
+        """
+        self.t = time.time()
+        interval = INTERVAL if self.tty else LOG_INTERVAL
+        while not result.ready():
+            result.wait(interval)
+            self.render(time.time(), result.ready())
+        return result.get()
+
+    def run(self, pool, func, workers, budget):
+        """
+        apply func to the files in the pool, starting a file only while the peak RSS of the running
+        workers plus the largest peak seen so far fits in the budget (Mb). one file is run alone until
+        a worker reported its RSS, and one file always runs whatever the budget.
+        returns the results in the order of the files, rendering meanwhile
+        """
+        self.t = last = time.time()
+        interval = INTERVAL if self.tty else LOG_INTERVAL
+        a = self.array
+        pending = list(range(len(self.files)))
+        running = {}  # index of the file -> (async result, RSS assumed at the submission)
+        results = [None] * len(self.files)
+        throttled = False
+        while pending or running:
+            for i, (result, _) in list(running.items()):
+                if result.ready():
+                    results[i] = result.get()
+                    del running[i]
+            peak = max(a[i * FIELDS + RSS] for i in range(len(self.files)))
+            while pending and len(running) < workers and (not running or peak):
+                used = sum(max(a[i * FIELDS + RSS], assumed) for i, (_, assumed) in running.items())
+                if running and used + peak > budget:
+                    if not throttled:
+                        LOG.warning('memory budget of %d Mb reached, running %d file(s) at a time, '
+                                    '%.0f Mb per worker' % (budget, len(running), peak))
+                        throttled = True
+                    break
+                i = pending.pop(0)
+                running[i] = pool.apply_async(func, (self.files[i],)), peak
+            time.sleep(POLL)
+            now = time.time()
+            if now - last >= interval or not (pending or running):
+                self.render(now, not (pending or running))
+                last = now
+        return results
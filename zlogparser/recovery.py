@@ -1,6 +1,10 @@
 from __future__ import print_function
 
 cache = {}
+stats = {'hits': 0, 'misses': 0}
+
+FUNCTION_COLUMN = '%-40s'
+FILELINE_COLUMN = '%-50s:%-4s'
 
 
 def recover(function, fileline, tags=None):
@@ -10,8 +14,10 @@ def recover(function, fileline, tags=None):
         tags = tagindex.tags
         cache = tagindex.cache
     if (function, fileline) in cache:
+        stats['hits'] += 1
         return cache[(function, fileline)]
     else:
+        stats['misses'] += 1
         path, lineno = fileline.split(':')
         lineno = int(lineno)
         tag_match = []
@@ -37,6 +43,35 @@ def recover(function, fileline, tags=None):
         return func, path, lineno
 
 
+def recover_block(rows, columns=None, tags=None, function_idx=5, fileline_idx=4):
+    """
+    recover a block of log rows at once, every distinct (function, fileline)
+    pair is resolved and formatted only once.
+    `columns` is the formatted column cache, pass the same dict for every
+    block of a result set to share it across blocks.
+    returns the formatted (function, fileline) columns in the order of rows.
+    """
+    if columns is None:
+        columns = {}
+    keys = [(r[function_idx], r[fileline_idx]) for r in rows]
+    for key in set(keys).difference(columns):
+        func, path, lineno = recover(key[0], key[1], tags)
+        columns[key] = (FUNCTION_COLUMN % func, FILELINE_COLUMN % (path, lineno))
+    return [columns[k] for k in keys]
+
+
+def iter_blocks(cur, block_size=4096):
+    fetchmany = getattr(cur, 'fetchmany', None)
+    if fetchmany is None:
+        it = iter(cur)
+        fetchmany = lambda n: [r for _, r in zip(range(n), it)]
+    while True:
+        rows = fetchmany(block_size)
+        if not rows:
+            break
+        yield rows
+
+
 if __name__ == '__main__':
     print(recover('ProcessStateDeltaFro', 'ckProcessing.cpp:788'))
     print(recover('ProcessStateDelta', 'ckProcessing.cpp:788'))
@@ -0,0 +1,98 @@
+# coding=utf-8
+"""
+Per time bucket counters of the logs, built while the logs are inserted.
+
+Logs are counted by (bucket, level, tid, function), the bucket is the puttime
+truncated to the second or to the minute. Counters are kept in memory and
+flushed into the rollup table once too many are pending, as logs come in time
+order the pending counters are almost always of the last few buckets.
+"""
+import datetime
+import logging
+
+LOG = logging.getLogger()
+
+# granularity -> length of the puttime prefix of a bucket
+GRANULARITY = {
+    '1s': len('YYYY-MM-DD HH:MM:SS'),
+    '1m': len('YYYY-MM-DD HH:MM'),
+}
+
+# re-bucketing of the rollups when reading them
+PERIODS = {
+    'second': len('YYYY-MM-DD HH:MM:SS'),
+    'minute': len('YYYY-MM-DD HH:MM'),
+    'hour': len('YYYY-MM-DD HH'),
+    'day': len('YYYY-MM-DD'),
+}
+
+# puttime prefix length -> (strptime format, bucket step)
+BUCKET_FORMATS = {
+    19: ('%Y-%m-%d %H:%M:%S', datetime.timedelta(seconds=1)),
+    16: ('%Y-%m-%d %H:%M', datetime.timedelta(minutes=1)),
+    13: ('%Y-%m-%d %H', datetime.timedelta(hours=1)),
+    10: ('%Y-%m-%d', datetime.timedelta(days=1)),
+}
+
+MAX_PENDING = 1 << 16
+
+SPARK = u' ▁▂▃▄▅▆▇█'
+
+
+class Rollup(object):
+    def __init__(self, store, granularity='1m', max_pending=MAX_PENDING):
+        self.store = store
+        self.width = GRANULARITY[granularity]
+        self.max_pending = max_pending
+        self._counts = {}
+        store.create_rollup_table()
+
+    def add(self, log):
+        level, tid, puttime, _, function = log[:5]
+        key = (puttime[:self.width], level, tid, function)
+        self._counts[key] = self._counts.get(key, 0) + 1
+        if len(self._counts) >= self.max_pending:
+            self.flush()
+
+    def add_many(self, logs):
+        for log in logs:
+            self.add(log)
+
+    def flush(self):
+        if not self._counts:
+            return
+        LOG.debug('flushing %s rollup counters' % len(self._counts))
+        self.store.put_rollup_many((k + (v,) for k, v in self._counts.items()))
+        self._counts = {}
+
+    close = flush
+
+
+def fill_buckets(counts, width):
+    """
+    every bucket from the first to the last one of the counts dict, with 0 for buckets without logs
+    """
+    if not counts:
+        return []
+    fmt, step = BUCKET_FORMATS[width]
+    t = datetime.datetime.strptime(min(counts), fmt)
+    last = datetime.datetime.strptime(max(counts), fmt)
+    filled = []
+    while t <= last:
+        b = t.strftime(fmt)
+        filled.append((b, counts.get(b, 0)))
+        t += step
+    return filled
+
+
+def sparkline(counts, top=None):
+    """
+    a line of block characters scaled to the highest count (or top)
+    """
+    top = top or max(counts or [0]) or 1
+    steps = len(SPARK) - 1
+    return u''.join(SPARK[max(1, int(round(float(c) / top * steps))) if c else 0] for c in counts)
+
+
+def bar(count, top, width=50):
+    return u'█' * int(round(float(count) / (top or 1) * width))
@@ -0,0 +1,76 @@
+"""
+Mergeable quantile sketch of durations.
+
+Values are counted in logarithmic buckets, bucket i holds the values in
+(gamma^(i-1), gamma^i] with gamma = (1 + accuracy) / (1 - accuracy), so every
+quantile is returned within the relative accuracy of the true value whatever
+the distribution. Sketches of the same accuracy are merged by adding their
+bucket counts, e.g. to combine time windows or nodes.
+"""
+import marshal
+import math
+
+ACCURACY = 0.01
+MIN_VALUE = 1e-6  # durations below a microsecond are counted as zero
+
+
+class Sketch(object):
+    def __init__(self, accuracy=ACCURACY):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if value < MIN_VALUE:
+            self.zeros += 1
+            return
+        i = int(math.ceil(math.log(value) / self._log_gamma))
+        self.buckets[i] = self.buckets.get(i, 0) + 1
+
+    def merge(self, other):
+        if other.accuracy != self.accuracy:
+            raise ValueError('can not merge sketches of different accuracy')
+        for i, c in other.buckets.items():
+            self.buckets[i] = self.buckets.get(i, 0) + c
+        self.zeros += other.zeros
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for i in sorted(self.buckets):
+            seen += self.buckets[i]
+            if rank < seen:
+                # the middle of the bucket, within accuracy of both bounds
+                return min(2 * self.gamma ** i / (self.gamma + 1), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def dumps(self):
+        return marshal.dumps((self.accuracy, self.zeros, self.count, self.total, self.max, self.buckets), 2)
+
+    @classmethod
+    def loads(cls, blob):
+        accuracy, zeros, count, total, maximum, buckets = marshal.loads(bytes(blob))
+        sketch = cls(accuracy)
+        sketch.zeros, sketch.count, sketch.total, sketch.max, sketch.buckets = zeros, count, total, maximum, buckets
+        return sketch
@@ -0,0 +1,156 @@
+"""
+Call spans rebuilt from the BEG/END logs of every thread.
+
+Logs are streamed in id order and a stack of open calls is kept per thread, an
+END closes the innermost open call of the same function and fileline, the calls
+opened after it on the thread never ended and are dropped. An END without a
+matching BEG is ignored. Stacks are bounded, so memory only depends on the
+number of threads.
+"""
+import calendar
+import datetime
+from collections import namedtuple
+
+MAX_DEPTH = 256
+
+SQL_SELECT_CALLS = "SELECT id, tid, puttime, function, fileline, message FROM log WHERE message IN ('BEG', 'END')"
+
+# bin sizes of the interval index, in milliseconds: 2^10 (~1s) up to 2^40 (~35 years)
+BIN_SHIFTS = (10, 13, 16, 19, 22, 25, 28, 31, 34, 37, 40)
+
+# begin and end are seconds since epoch
+Span = namedtuple('Span', 'tid function fileline begin_id end_id begin end depth')
+
+_DAYS = {}
+
+
+def puttime_seconds(puttime):
+    """
+    seconds since epoch of a 'YYYY-MM-DD HH:MM:SS.sss' puttime, much faster than strptime
+    """
+    day = puttime[:10]
+    base = _DAYS.get(day)
+    if base is None:
+        base = _DAYS[day] = calendar.timegm(datetime.datetime.strptime(day, '%Y-%m-%d').timetuple())
+    return base + int(puttime[11:13]) * 3600 + int(puttime[14:16]) * 60 + float(puttime[17:])
+
+
+def pad_puttime(puttime):
+    """
+    complete a datetime prefix given by the user, e.g. '2019-02-08 12:03', to a full puttime
+    """
+    return puttime + '1970-01-01 00:00:00.000'[len(puttime):]
+
+
+def seconds_puttime(seconds):
+    t = datetime.datetime.utcfromtimestamp(seconds)
+    return t.strftime('%Y-%m-%d %H:%M:%S.%f')[:23]
+
+
+class SpanBuilder(object):
+    def __init__(self, max_depth=MAX_DEPTH):
+        self.max_depth = max_depth
+        self.stacks = {}  # tid -> [(function, fileline, begin id, begin seconds)]
+        self.unmatched = 0
+
+    def feed(self, lid, tid, puttime, function, fileline, message):
+        """
+        feed a BEG or END log, returns the closed Span or None
+        """
+        stack = self.stacks.get(tid)
+        if stack is None:
+            stack = self.stacks[tid] = []
+        if message == 'BEG':
+            if len(stack) >= self.max_depth:
+                del stack[0]
+                self.unmatched += 1
+            stack.append((function, fileline, lid, puttime_seconds(puttime)))
+            return None
+        for depth in range(len(stack) - 1, -1, -1):
+            if stack[depth][0] == function and stack[depth][1] == fileline:
+                break
+        else:
+            self.unmatched += 1
+            return None
+        self.unmatched += len(stack) - depth - 1
+        _, _, begin_id, begin = stack[depth]
+        del stack[depth:]
+        return Span(tid, function, fileline, begin_id, lid, begin, puttime_seconds(puttime), depth)
+
+    def open_calls(self):
+        """
+        (tid, depth, function, fileline, begin id, begin seconds) of the calls that never ended
+        """
+        for tid, stack in self.stacks.items():
+            for depth, (function, fileline, lid, begin) in enumerate(stack):
+                yield tid, depth, function, fileline, lid, begin
+
+
+def span_bin(begin, end):
+    """
+    (level, bin) of the smallest bin holding the whole [begin, end] interval of milliseconds,
+    intervals fitting in no bin go to a single top level bin.
+    an interval overlapping a point only lives in the bins of that point at every level,
+    so a point (or range) query is one lookup per level.
+    """
+    for level, shift in enumerate(BIN_SHIFTS):
+        if begin >> shift == end >> shift:
+            return level, begin >> shift
+    return len(BIN_SHIFTS), 0
+
+
+def range_bins(begin, end):
+    """
+    (level, first bin, last bin) of every level for the intervals overlapping [begin, end]
+    """
+    return [(level, begin >> shift, end >> shift) for level, shift in enumerate(BIN_SHIFTS)] + \
+        [(len(BIN_SHIFTS), 0, 0)]
+
+
+def iter_folded(rows, per_thread=False, name=None, max_stacks=1 << 16):
+    """
+    Brendan Gregg's folded stacks ('root;caller;callee weight') of BEG/END rows in id order,
+    weighted by the self time of the calls in milliseconds. Stacks are summed in memory and
+    written out whenever there are too many of them, the same stack may then come more than once.
+    """
+    builder = SpanBuilder()
+    children = {}  # tid -> [total time of the closed calls made at every depth]
+    folded = {}
+    name = name or (lambda function, fileline: function)
+    for span in iter_spans(rows, builder):
+        duration = span.end - span.begin
+        totals = children.get(span.tid)
+        if totals is None:
+            totals = children[span.tid] = []
+        # the deeper totals are of the calls below this one, or of the calls that never ended above it
+        weight = int(round((duration - sum(totals[span.depth + 1:span.depth + 2])) * 1000))
+        del totals[span.depth + 1:]
+        if span.depth:
+            totals.extend([0.0] * (span.depth + 1 - len(totals)))
+            totals[span.depth] += duration
+        if weight <= 0:
+            continue
+        # the callers are still on the stack of the thread
+        frames = [name(f, fl) for f, fl, _, _ in builder.stacks[span.tid]] + [name(span.function, span.fileline)]
+        if per_thread:
+            frames.insert(0, 'thread %s' % span.tid)
+        stack = ';'.join(frames)
+        folded[stack] = folded.get(stack, 0) + weight
+        if len(folded) >= max_stacks:
+            for item in folded.items():
+                yield item
+            folded.clear()
+    for item in folded.items():
+        yield item
+
+
+def iter_spans(rows, builder=None):
+    """
+    the closed spans of (id, tid, puttime, function, fileline, message) BEG/END rows in id order
+    """
+    builder = builder or SpanBuilder()
+    feed = builder.feed
+    for row in rows:
+        span = feed(*row)
+        if span is not None:
+            yield span
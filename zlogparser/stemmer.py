@@ -192,8 +192,7 @@ class EnglishStemmer(_StandardStemmer):
                        "succeeded": "succeed",
                        "succeeding": "succeed"}
 
-    @lru_cache(512)
-    def stem(self, word):
+    def stem_word(self, word):
 
         """
         Stem an English word and return the stemmed form.
@@ -563,6 +562,9 @@ class EnglishStemmer(_StandardStemmer):
         word = word.replace("Y", "y")
         return word
 
+    # uncached version is stem_word, for bulk tokenizing see tokenizer.StemCache
+    stem = lru_cache(512)(stem_word)
+
 
 if __name__ == '__main__':
     msg = 'State root hash = 573e4975096ebd6368963d5df85d22afae4611bbdd4b0d3d4fbcfc29ac3234c4 ' \
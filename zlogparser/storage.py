@@ -1,11 +1,38 @@
 import errno
 import logging
+import math
 import os
+import re
 import sqlite3
+import struct
+from collections import deque
 from contextlib import contextmanager
 
-from tokenizer import tokenize
+import profiling
+from bitmap import Bitmap
+from bitmap import BitmapBuilder
+from postings import PostingsReader
+from postings import PostingsWriter
+from postings import decode_varints
+from postings import difference
+from postings import union
+from sketch import Sketch
+from spans import SQL_SELECT_CALLS
+from spans import SpanBuilder
+from spans import iter_spans
+from spans import pad_puttime
+from spans import puttime_seconds
+from spans import range_bins
+from spans import seconds_puttime
+from spans import span_bin
+from tokenizer import extract_hashes
+from tokenizer import extract_kv
+from tokenizer import extract_peers
+from tokenizer import tokenize_positions
+from tokenizer import trigrams
 from utils import cached_property
+from utils import levenshtein
+from utils import measure_time
 
 LOG = logging.getLogger()
 
@@ -29,21 +56,407 @@ CREATE TABLE IF NOT EXISTS items (
 )
 '''
 
-# type: 0 - message; 1 - fileline
-SQL_CREATE_TABLE_INVERTED_INDEX = '''
-CREATE TABLE IF NOT EXISTS invidx (
-    word TEXT    NOT NULL,
+SQL_CREATE_TABLE_HASH_INDEX = '''
+CREATE TABLE IF NOT EXISTS hashidx (
+    hash TEXT    NOT NULL,
     id   INTEGER NOT NULL,
-    type INTEGER NOT NULL,
-    PRIMARY KEY (word, id)
+    PRIMARY KEY (hash, id)
 )
 '''
 
+SQL_CREATE_TABLE_PEER = '''
+CREATE TABLE IF NOT EXISTS peer (
+    addr   TEXT     NOT NULL,
+    id     INTEGER  NOT NULL,
+    minute CHAR(16) NOT NULL,
+    len    INTEGER,
+    PRIMARY KEY (addr, id)
+)
+'''
+
+# per-minute rollup of the peer table
+SQL_CREATE_TABLE_PEER_MINUTE = '''
+CREATE TABLE IF NOT EXISTS peer_minute (
+    addr   TEXT     NOT NULL,
+    minute CHAR(16) NOT NULL,
+    count  INTEGER  NOT NULL,
+    bytes  INTEGER  NOT NULL,
+    PRIMARY KEY (addr, minute)
+)
+'''
+
+SQL_CREATE_TABLE_KV = '''
+CREATE TABLE IF NOT EXISTS kv (
+    key   TEXT    NOT NULL,
+    value NUMERIC NOT NULL,
+    id    INTEGER NOT NULL
+)
+'''
+
+# the terms of the full-text index, and their trigrams for fuzzy lookup
+SQL_CREATE_TABLE_VOCAB = '''
+CREATE TABLE IF NOT EXISTS vocab (
+    id        INTEGER NOT NULL PRIMARY KEY,
+    term      TEXT    NOT NULL UNIQUE,
+    len       INTEGER NOT NULL,
+    documents INTEGER NOT NULL
+)
+'''
+
+SQL_CREATE_TABLE_VOCAB_GRAM = '''
+CREATE TABLE IF NOT EXISTS vocab_gram (
+    gram TEXT    NOT NULL,
+    vid  INTEGER NOT NULL,
+    PRIMARY KEY (gram, vid)
+)
+'''
+
+# log counts per time bucket, see rollup.py
+SQL_CREATE_TABLE_ROLLUP = '''
+CREATE TABLE IF NOT EXISTS rollup (
+    bucket   CHAR(19) NOT NULL,
+    level    CHAR(8)  NOT NULL,
+    tid      INTEGER  NOT NULL,
+    function CHAR(20) NOT NULL,
+    count    INTEGER  NOT NULL,
+    PRIMARY KEY (bucket, level, tid, function)
+)
+'''
+
+# per function and per minute duration sketches of the BEG/END calls, see sketch.py
+SQL_CREATE_TABLE_LATENCY = '''
+CREATE TABLE IF NOT EXISTS latency (
+    function CHAR(20) NOT NULL,
+    fileline CHAR(20),
+    window   CHAR(16) NOT NULL,
+    count    INTEGER  NOT NULL,
+    total    REAL     NOT NULL,
+    max      REAL     NOT NULL,
+    sketch   BLOB     NOT NULL
+)
+'''
+
+# the BEG/END calls, begin and end are milliseconds since epoch, (lvl, bin) is the interval bin of spans.py.
+# calls never ended are open and end at the last log.
+SQL_CREATE_TABLE_SPAN = '''
+CREATE TABLE IF NOT EXISTS span (
+    tid      INTEGER  NOT NULL,
+    depth    INTEGER  NOT NULL,
+    function CHAR(20) NOT NULL,
+    fileline CHAR(20),
+    begin_id INTEGER  NOT NULL,
+    end_id   INTEGER,
+    begin    INTEGER  NOT NULL,
+    end      INTEGER  NOT NULL,
+    lvl      INTEGER  NOT NULL,
+    bin      INTEGER  NOT NULL
+)
+'''
+
+# silences and rate spikes found while indexing, see anomaly.py
+SQL_CREATE_TABLE_EVENTS = '''
+CREATE TABLE IF NOT EXISTS events (
+    kind     TEXT     NOT NULL,
+    key      TEXT     NOT NULL,
+    start    CHAR(23) NOT NULL,
+    end      CHAR(23) NOT NULL,
+    value    REAL     NOT NULL,
+    baseline REAL
+)
+'''
+
+SQL_CREATE_FTS = "CREATE VIRTUAL TABLE IF NOT EXISTS {db}ftsidx USING fts4(content='log', message, tokenize=porter)"
+
+SQL_CREATE_TABLE_BITMAP = '''
+CREATE TABLE IF NOT EXISTS bitmap (
+    field TEXT NOT NULL,
+    value TEXT NOT NULL,
+    data  BLOB NOT NULL,
+    PRIMARY KEY (field, value)
+)
+'''
+
+BITMAP_FIELDS = ('level', 'tid', 'function')
+
+FILTER_FIELD_REG = re.compile(r'^(%s)=(.+)$' % '|'.join(BITMAP_FIELDS))
+
+QUERY_TOKEN_REG = re.compile(r'-?"[^"]*"|[()]|[^\s()]+')
+
+QUERY_OPERATORS = frozenset(('AND', 'OR', 'NOT'))
+
 SQL_CREATE_INDEX_LVL = 'CREATE INDEX IF NOT EXISTS log_level ON  log (level)'
 SQL_CREATE_INDEX_TID = 'CREATE INDEX IF NOT EXISTS log_tid ON  log (tid)'
 SQL_CREATE_INDEX_TME = 'CREATE INDEX IF NOT EXISTS log_puttime ON log (puttime)'
 SQL_CREATE_INDEX_FUN = 'CREATE INDEX IF NOT EXISTS log_function ON log (function)'
 SQL_CREATE_INDEX_FIL = 'CREATE INDEX IF NOT EXISTS log_fileline ON log (fileline)'
+SQL_CREATE_INDEX_KV = 'CREATE INDEX IF NOT EXISTS kv_key_value ON kv (key, value)'
+SQL_CREATE_INDEX_LATENCY = 'CREATE INDEX IF NOT EXISTS latency_window ON latency (window)'
+SQL_CREATE_INDEX_SPAN_BIN = 'CREATE INDEX IF NOT EXISTS span_bin ON span (lvl, bin)'
+SQL_CREATE_INDEX_VOCAB_LEN = 'CREATE INDEX IF NOT EXISTS vocab_len ON vocab (len)'
+
+
+def bm25(matchinfo, k1=1.2, b=0.75):
+    """
+    Okapi BM25 of a row from FTS matchinfo(ftsidx, 'pcnalx')
+    """
+    mi = struct.unpack('@%dI' % (len(matchinfo) // 4), matchinfo)
+    phrases, columns, total = mi[0], mi[1], mi[2]
+    score = 0.0
+    for col in range(columns):
+        avg_len = mi[3 + col] or 1
+        doc_len = mi[3 + columns + col]
+        norm = k1 * (1 - b + b * float(doc_len) / avg_len)
+        for p in range(phrases):
+            x = 3 + 2 * columns + 3 * (p * columns + col)
+            tf, df = mi[x], mi[x + 2]
+            if tf:
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + norm)
+    return score
+
+
+def _read_varint(buf, offset=0):
+    n = shift = 0
+    while True:
+        b = buf[offset]
+        offset += 1
+        n |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return n, offset
+        shift += 7
+
+
+def _varint(n):
+    buf = bytearray()
+    while n > 0x7f:
+        buf.append((n & 0x7f) | 0x80)
+        n >>= 7
+    buf.append(n)
+    return buf
+
+
+def _shift_fts_node(node, offset):
+    """
+    move the child block ids of an FTS segment b-tree node by offset, leaves (height 0) have none
+    """
+    node = bytearray(node)
+    height, pos = _read_varint(node)
+    if not height:
+        return node
+    child, end = _read_varint(node, pos)
+    return node[:pos] + _varint(child + offset) + node[end:]
+
+
+def build_fts_segment(args):
+    """
+    build the FTS segment of the logs with id in [low, high] into its own sqlite file, run in worker processes
+    """
+    db_path, segment_path, low, high = args
+    if os.path.exists(segment_path):
+        os.remove(segment_path)
+    con = sqlite3.connect(segment_path)
+    con.execute('PRAGMA synchronous = OFF')
+    con.execute('PRAGMA journal_mode = MEMORY')
+    con.execute('ATTACH DATABASE ? AS src', (db_path,))
+    con.execute(SQL_CREATE_FTS.format(db='main.'))
+    con.execute('INSERT INTO ftsidx(docid, message) SELECT id, message FROM src.log WHERE id BETWEEN ? AND ?',
+                (low, high))
+    con.commit()
+    con.close()
+    return segment_path
+
+
+NEAR_REG = re.compile(r'^NEAR(?:/(\d+))?$')
+
+
+def split_or(q):
+    """
+    the AND groups of a query of the postings index joined by OR, which binds looser than AND and NOT.
+    parentheses are not supported and raise a ValueError
+    """
+    groups = [[]]
+    for token in QUERY_TOKEN_REG.findall(q):
+        if token in ('(', ')'):
+            raise ValueError('parentheses are not supported by the py engine: %s' % q)
+        if token == 'OR':
+            groups.append([])
+        else:
+            groups[-1].append(token)
+    return [' '.join(g) for g in groups if g]
+
+
+def parse_query(q):
+    """
+    parse a query of the postings index into (words, excluded words, phrases, excluded phrases, nears).
+    a phrase is the list of (token, offset) of its words, nears are (left phrase, right phrase, k).
+    """
+    words, excluded, phrases, excluded_phrases, nears = set(), set(), [], [], []
+    last = near = None
+    negate = False
+    for token in QUERY_TOKEN_REG.findall(q):
+        if token in ('AND', '(', ')'):
+            continue
+        if token == 'NOT':
+            negate = True
+            continue
+        m = NEAR_REG.match(token)
+        if m:
+            near = int(m.group(1) or 10)
+            continue
+        if token.startswith('-'):
+            negate, token = True, token[1:]
+        tokens = next(tokenize_positions([token.strip('"')]))
+        if not tokens:
+            negate, near = False, None
+            continue
+        start = min(min(p) for p in tokens.values())
+        operand = sorted(((t, p - start) for t, positions in tokens.items() for p in positions), key=lambda i: i[1])
+        if negate:
+            if token.startswith('"'):
+                excluded_phrases.append(operand)
+            else:
+                excluded.update(tokens)
+        else:
+            words.update(tokens)
+            if token.startswith('"') and len(operand) > 1:
+                phrases.append(operand)
+            if near is not None and last is not None:
+                nears.append((last, operand, near))
+            last = operand
+        negate, near = False, None
+    return words, excluded, phrases, excluded_phrases, nears
+
+
+def parse_filter(expr):
+    """
+    parse a filter expression into a tree of ('and'|'or', left, right), ('not', operand),
+    ('field', name, value) and ('match', fts query) nodes.
+    operands are `level=X`, `tid=X`, `function=X` or full-text queries (quote them for phrases),
+    combined by AND (implicit), OR, NOT and parentheses.
+    """
+    tokens = QUERY_TOKEN_REG.findall(expr)
+    pos = [0]
+
+    def peek():
+        return tokens[pos[0]] if pos[0] < len(tokens) else None
+
+    def take():
+        pos[0] += 1
+        return tokens[pos[0] - 1]
+
+    def parse_or():
+        node = parse_and()
+        while peek() == 'OR':
+            take()
+            node = ('or', node, parse_and())
+        return node
+
+    def parse_and():
+        node = parse_not()
+        while peek() not in (None, 'OR', ')'):
+            if peek() == 'AND':
+                take()
+            node = ('and', node, parse_not())
+        return node
+
+    def parse_not():
+        token = peek()
+        if token is None:
+            raise ValueError('unexpected end of filter: %s' % expr)
+        if token == 'NOT':
+            take()
+            return 'not', parse_not()
+        if token == '(':
+            take()
+            node = parse_or()
+            if take() != ')':
+                raise ValueError('missing ")" in filter: %s' % expr)
+            return node
+        take()
+        m = FILTER_FIELD_REG.match(token)
+        if m:
+            return 'field', m.group(1), m.group(2)
+        return 'match', token
+
+    node = parse_or()
+    if peek() is not None:
+        raise ValueError('unexpected "%s" in filter: %s' % (peek(), expr))
+    return node
+
+
+def _windows(ids, anchors, before, after):
+    """
+    merged (first id, last id, anchor ids) windows in one pass over the sorted ids of a thread
+    """
+    anchors = iter(anchors)
+    next_anchor = next(anchors, None)
+    history = deque(maxlen=before or 1)
+    window = None  # [first, last, logs still to add after the last anchor, logs since last, anchors]
+    for i in ids:
+        if i == next_anchor:
+            next_anchor = next(anchors, None)
+            if window is not None and window[3] <= before:
+                window[1], window[2], window[3] = i, after, 0
+                window[4].append(i)
+            else:
+                if window is not None:
+                    yield window[0], window[1], window[4]
+                window = [history[0] if before and history else i, i, after, 0, [i]]
+        elif window is not None:
+            if window[2] > 0:
+                window[1] = i
+                window[2] -= 1
+            else:
+                window[3] += 1
+                if window[3] > before:
+                    yield window[0], window[1], window[4]
+                    window = None
+        history.append(i)
+    if window is not None:
+        yield window[0], window[1], window[4]
+
+
+class PositionCursor(object):
+    """
+    walks the (id, positions) postings of a token, ids must be sought in ascending order
+    """
+
+    def __init__(self, postings):
+        self._it = iter(postings)
+        self._id, self._positions = next(self._it, (None, None))
+
+    def seek(self, lid):
+        while self._id is not None and self._id < lid:
+            self._id, self._positions = next(self._it, (None, None))
+        return self._positions if self._id == lid else None
+
+
+def phrase_starts(phrase, positions):
+    """
+    the positions where every (token, offset) of the phrase is found at start + offset
+    """
+    first, first_offset = phrase[0]
+    if not positions.get(first):
+        return []
+    rest = []
+    for t, offset in phrase[1:]:
+        p = positions.get(t)
+        if not p:
+            return []
+        rest.append((frozenset(p), offset))
+    return [
+        p - first_offset for p in positions[first]
+        if all(p - first_offset + offset in ps for ps, offset in rest)
+    ]
+
+
+def is_near(left, right, k, positions):
+    left_span, right_span = left[-1][1], right[-1][1]
+    for l in phrase_starts(left, positions):
+        for r in phrase_starts(right, positions):
+            if 0 <= r - (l + left_span) - 1 <= k or 0 <= l - (r + right_span) - 1 <= k:
+                return True
+    return False
 
 
 class LogStorage(object):
@@ -63,6 +476,10 @@ class LogStorage(object):
     def __del__(self):
         self.close()
 
+    @staticmethod
+    def sqlite_version():
+        return sqlite3.sqlite_version
+
     def init(self):
         if not os.path.exists(self.storage_dir):
             LOG.info('creating index storage dir: %s' % self.storage_dir)
@@ -106,26 +523,715 @@ class LogStorage(object):
     def is_fts(self):
         return self.con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='ftsidx'").fetchone()
 
-    def create_fulltext_index_fts(self):
+    def create_fulltext_index_fts(self, workers=1):
         # https://www.sqlite.org/fts3.html#section_3
-        self.con.execute(
-            "CREATE VIRTUAL TABLE IF NOT EXISTS ftsidx USING fts4(content='log', message, tokenize=porter)"
-        )
-        self.con.execute("INSERT INTO ftsidx(docid, message) SELECT id, message FROM log")
+        self.con.execute(SQL_CREATE_FTS.format(db=''))
+        if workers <= 1:
+            self.con.execute("INSERT INTO ftsidx(docid, message) SELECT id, message FROM log")
+            return
+        from multiprocessing import Pool
+
+        low, high = self.con.execute('SELECT min(id), max(id) FROM log').fetchone()
+        if low is None:
+            return
+        self.con.commit()
+        step = (high - low) // workers + 1
+        shards = [
+            (self.path, '%s-fts%d' % (self.path, n), low + n * step, min(high, low + (n + 1) * step - 1))
+            for n in range(workers) if low + n * step <= high
+        ]
+        pool = Pool(len(shards))
+        try:
+            with measure_time("build %d full-text segments" % len(shards)):
+                segments = pool.map(build_fts_segment, shards)
+        finally:
+            pool.close()
+        with measure_time("merge %d full-text segments" % len(segments)):
+            for segment in segments:
+                self.merge_fts_segment(segment)
+                os.remove(segment)
+
+    def merge_fts_segment(self, segment_path):
+        """
+        move the FTS b-trees of a segment file into ftsidx, the docids of the segment must not be in ftsidx yet.
+        blocks are appended after the existing ones, so only the child pointers of interior nodes are rewritten.
+        """
+        con = self.con
+        con.execute('ATTACH DATABASE ? AS seg', (segment_path,))
+        try:
+            offset = con.execute('SELECT ifnull(max(blockid), 0) FROM ftsidx_segments').fetchone()[0]
+            con.execute('INSERT INTO ftsidx_segments (blockid, block) '
+                        'SELECT blockid + ?, block FROM seg.ftsidx_segments', (offset,))
+            segdirs = con.execute('SELECT level, start_block, leaves_end_block, end_block, root '
+                                  'FROM seg.ftsidx_segdir ORDER BY level, idx').fetchall()
+            for level, start, leaves_end, end, root in segdirs:
+                end, _, size = str(end).partition(' ')
+                end = int(end)
+                if end:
+                    interior = con.execute('SELECT blockid, block FROM seg.ftsidx_segments '
+                                           'WHERE blockid > ? AND blockid <= ?', (leaves_end, end)).fetchall()
+                    for blockid, block in interior:
+                        con.execute('UPDATE ftsidx_segments SET block=? WHERE blockid=?',
+                                    (sqlite3.Binary(_shift_fts_node(block, offset)), blockid + offset))
+                    start, leaves_end, end = start + offset, leaves_end + offset, end + offset
+                    root = _shift_fts_node(root, offset)
+                idx = con.execute('SELECT ifnull(max(idx) + 1, 0) FROM ftsidx_segdir WHERE level=?',
+                                  (level,)).fetchone()[0]
+                con.execute(
+                    'INSERT INTO ftsidx_segdir (level, idx, start_block, leaves_end_block, end_block, root) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (level, idx, start, leaves_end, '%s %s' % (end, size) if size else end, sqlite3.Binary(root))
+                )
+            con.execute('INSERT INTO ftsidx_docsize (docid, size) SELECT docid, size FROM seg.ftsidx_docsize')
+            # stat 0 holds the number of docs followed by the number of tokens of every column
+            totals = []
+            for stat in (con.execute('SELECT value FROM ftsidx_stat WHERE id=0').fetchone(),
+                         con.execute('SELECT value FROM seg.ftsidx_stat WHERE id=0').fetchone()):
+                for n, v in enumerate(decode_varints(stat[0]) if stat else ()):
+                    if n < len(totals):
+                        totals[n] += v
+                    else:
+                        totals.append(v)
+            con.execute('INSERT OR REPLACE INTO ftsidx_stat (id, value) VALUES (0, ?)',
+                        (sqlite3.Binary(b''.join(bytes(_varint(n)) for n in totals)),))
+            con.commit()
+        finally:
+            con.execute('DETACH DATABASE seg')
 
     def search(self, q):
         return self.con.execute("select * from log where id in (select docid from ftsidx where message match ?)", (q,))
 
-    def create_fulltext_index_py(self):
-        self.con.execute(SQL_CREATE_TABLE_INVERTED_INDEX)
-        cur = self.con.execute("SELECT id, fileline, message FROM log")
-        for lid, fileline, message in cur:
-            if message in ('BEG', 'END'):
+    def search_top(self, q, top, recency=0.0, newest=False, snippet=None):
+        """
+        the top matches of q ranked by BM25, optionally boosted by recency (score * (1 + recency * id / max id)).
+        with newest, the newest matches are returned instead, which stops the full-text scan after `top` hits.
+        snippet is a (start, end) pair of highlight marks to replace message by a highlighted snippet.
+        returns the log rows in ranked order.
+        """
+        if newest:
+            ids = [i for i, in self.con.execute(
+                'SELECT docid FROM ftsidx WHERE ftsidx MATCH ? ORDER BY docid DESC LIMIT ?', (q, top))]
+        else:
+            self.con.create_function('bm25', 1, bm25)
+            max_id = self.con.execute('SELECT max(id) FROM log').fetchone()[0] or 1
+            # only the docids and scores of the matches are sorted, log rows are fetched for the top ones
+            ids = [i for i, in self.con.execute(
+                "SELECT docid FROM ftsidx WHERE ftsidx MATCH ? "
+                "ORDER BY bm25(matchinfo(ftsidx, 'pcnalx')) * (1 + ? * docid / ?) DESC LIMIT ?",
+                (q, recency, float(max_id), top))]
+        if not ids:
+            return []
+        id_list = ','.join(map(str, ids))
+        rows = dict((r[0], r) for r in self.con.execute('SELECT * FROM log WHERE id IN (%s)' % id_list))
+        if snippet:
+            start, end = snippet
+            snippets = dict(self.con.execute(
+                "SELECT docid, snippet(ftsidx, ?, ?, '...', -1, 16) FROM ftsidx "
+                "WHERE ftsidx MATCH ? AND docid IN (%s)" % id_list, (start, end, q)))
+            rows = dict((i, r[:-1] + (snippets.get(i, r[-1]),)) for i, r in rows.items())
+        return [rows[i] for i in ids if i in rows]
+
+    def is_bitmap_index(self):
+        return self.con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='bitmap'").fetchone()
+
+    def create_bitmap_index(self):
+        self.con.execute(SQL_CREATE_TABLE_BITMAP)
+        builders = {}
+        cur = self.con.execute('SELECT id, %s FROM log ORDER BY id' % ', '.join(BITMAP_FIELDS))
+        for row in cur:
+            lid = row[0]
+            for field, value in zip(BITMAP_FIELDS, row[1:]):
+                builder = builders.get((field, value))
+                if builder is None:
+                    builder = builders[(field, value)] = BitmapBuilder()
+                builder.add(lid)
+        self.con.executemany(
+            'INSERT INTO bitmap (field, value, data) VALUES (?, ?, ?)',
+            ((field, str(value), sqlite3.Binary(b.build().dumps())) for (field, value), b in builders.items())
+        )
+
+    def bitmap(self, field, value):
+        row = self.con.execute('SELECT data FROM bitmap WHERE field=? AND value=?', (field, str(value))).fetchone()
+        return Bitmap.loads(row[0]) if row else Bitmap()
+
+    def match_bitmap(self, q):
+        return Bitmap.from_sorted(
+            i for i, in self.con.execute('SELECT docid FROM ftsidx WHERE ftsidx MATCH ? ORDER BY docid', (q,)))
+
+    def all_bitmap(self):
+        return Bitmap.from_range(1, (self.con.execute('SELECT max(id) FROM log').fetchone()[0] or 0) + 1)
+
+    def filter_bitmap(self, expr):
+        """
+        evaluate a filter expression (see parse_filter) to the bitmap of matching log ids
+        """
+        def evaluate(node):
+            if node[0] == 'field':
+                return self.bitmap(node[1], node[2])
+            if node[0] == 'match':
+                return self.match_bitmap(node[1])
+            if node[0] == 'not':
+                return self.all_bitmap() - evaluate(node[1])
+            left, right = evaluate(node[1]), evaluate(node[2])
+            return left & right if node[0] == 'and' else left | right
+
+        return evaluate(parse_filter(expr))
+
+    def context_windows(self, levels, before, after, tid=None):
+        """
+        (tid, first id, last id, anchor ids) of the windows of `before` and `after` logs of the same thread
+        around the logs of the levels, overlapping or adjacent windows are merged.
+        anchors and threads come from the bitmap indexes, the windows are found by walking the ids of the thread.
+        """
+        anchors = Bitmap()
+        for level in levels:
+            anchors = anchors | self.bitmap('level', level)
+        if tid is not None:
+            tids = [tid]
+        else:
+            tids = sorted(int(v) for v, in self.con.execute("SELECT value FROM bitmap WHERE field='tid'"))
+        for t in tids:
+            ids = self.bitmap('tid', t)
+            thread_anchors = anchors & ids
+            if not len(thread_anchors):
+                continue
+            for lo, hi, window_anchors in _windows(ids, thread_anchors, before, after):
+                yield t, lo, hi, window_anchors
+
+    def thread_logs(self, tid, lo, hi):
+        return self.con.execute('SELECT * FROM log WHERE tid = ? AND id BETWEEN ? AND ? ORDER BY id', (tid, lo, hi))
+
+    def is_trigram_index(self):
+        return self.con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='trigram'").fetchone()
+
+    def create_trigram_index(self):
+        # postings of the lower-cased trigrams of every message, used to narrow down substring and regex search
+        self.con.execute('DROP TABLE IF EXISTS trigram')
+        writer = PostingsWriter(self.con, 'trigram')
+        for lid, message in self.con.execute('SELECT id, message FROM log ORDER BY id'):
+            writer.add(lid, trigrams(message.lower()))
+        writer.close()
+
+    def grep(self, match, alternatives, stats=None):
+        """
+        logs whose message passes match(message). alternatives is a list of lists of literals, if the
+        trigram index exists only the logs containing every trigram of the literals of one alternative
+        are checked.
+        stats is filled with the number of rows, candidates checked and matches.
+        """
+        stats = {} if stats is None else stats
+        stats['rows'] = self.con.execute('SELECT count(*) FROM log').fetchone()[0]
+        grams = [set(g for literal in literals for g in trigrams(literal)) for literals in alternatives]
+        stats['grams'] = len(set().union(*grams))
+        # an alternative without trigram may match any log
+        if grams and all(grams) and self.is_trigram_index():
+            reader = PostingsReader(self.con, 'trigram')
+            rows = self.get_logs(union([reader.all_of(g) for g in grams]))
+        else:
+            rows = self.con.execute('SELECT * FROM log')
+        stats['candidates'] = stats['matches'] = 0
+        for row in rows:
+            stats['candidates'] += 1
+            if match(row[-1]):
+                stats['matches'] += 1
+                yield row
+
+    def is_vocabulary(self):
+        return self.con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='vocab'").fetchone()
+
+    def create_vocabulary(self):
+        self.con.execute(SQL_CREATE_TABLE_VOCAB)
+        self.con.execute(SQL_CREATE_TABLE_VOCAB_GRAM)
+        self.con.execute('CREATE VIRTUAL TABLE IF NOT EXISTS temp.ftsterms USING fts4aux(main, ftsidx)')
+        self.con.execute(
+            "INSERT INTO vocab (term, len, documents) SELECT term, length(term), documents FROM temp.ftsterms "
+            "WHERE col='*'"
+        )
+        cur = self.con.execute('SELECT id, term FROM vocab')
+        self.con.executemany(
+            'INSERT INTO vocab_gram (gram, vid) VALUES (?, ?)',
+            ((g, vid) for vid, term in cur for g in trigrams(term))
+        )
+        self.con.execute(SQL_CREATE_INDEX_VOCAB_LEN)
+        self.con.execute('DROP TABLE temp.ftsterms')
+
+    def fts_stem(self, word):
+        """
+        the term the porter tokenizer of the fts index makes of word, None if it makes zero or several terms
+        """
+        self.con.execute('CREATE VIRTUAL TABLE IF NOT EXISTS temp.ftstok USING fts3tokenize(porter)')
+        tokens = self.con.execute('SELECT token FROM temp.ftstok WHERE input=?', (word,)).fetchall()
+        return tokens[0][0] if len(tokens) == 1 else None
+
+    def similar_terms(self, word, k=1):
+        """
+        terms of the vocabulary within edit distance k of word, a swap of two adjacent letters is one edit.
+        a term within k edits shares at least len(grams) - 4k trigrams with word, so only terms
+        passing that count are compared, short words fall back to comparing terms of similar length.
+        """
+        word = word.lower()
+        grams = trigrams(word)
+        need = len(grams) - 4 * k
+        length = (len(word) - k, len(word) + k)
+        if need > 0:
+            cur = self.con.execute(
+                'SELECT term FROM vocab WHERE len BETWEEN ? AND ? AND id IN ('
+                'SELECT vid FROM vocab_gram WHERE gram IN (%s) GROUP BY vid HAVING count(*) >= ?)'
+                % ','.join('?' * len(grams)),
+                length + tuple(grams) + (need,)
+            )
+        else:
+            cur = self.con.execute('SELECT term FROM vocab WHERE len BETWEEN ? AND ?', length)
+        return [t for t, in cur if levenshtein(word, t, k, transpositions=True) <= k]
+
+    def fuzzy_query(self, q, k=1):
+        """
+        rewrite a full-text query, every plain word is replaced by the OR of its similar terms.
+        the vocabulary holds porter stems, so the word is stemmed the same way before the lookup.
+        a similar stem is queried as is when the porter tokenizer leaves it unchanged, else by prefix.
+        """
+        result = []
+        for token in QUERY_TOKEN_REG.findall(q):
+            word = token.lstrip('-')
+            if (token in QUERY_OPERATORS or token in '()' or token.startswith('"') or
+                    not word.replace('_', '').isalnum() or word.startswith('NEAR')):
+                result.append(token)
+                continue
+            stem = self.fts_stem(word)
+            if stem is None:
+                result.append(token)
                 continue
-            tokens = tokenize(message)
-            words = ((w,) for w in tokens)
-            self.con.executemany("INSERT INTO invidx (word, id, type) VALUES (?, %s, 0)" % lid, words)
-        self.con.execute('CREATE INDEX IF NOT EXISTS inv_word ON invidx (word)')
+            terms = [word] + [t if self.fts_stem(t) == t else t + '*'
+                              for t in self.similar_terms(stem, k) if t != stem]
+            if len(terms) == 1:
+                result.append(token)
+            elif token.startswith('-'):
+                # NOT of standard syntax can't be applied to an OR group, exclude every term instead
+                result.extend('-' + t for t in terms)
+            else:
+                result.append('(%s)' % ' OR '.join(terms))
+        return ' '.join(result)
+
+    def is_invidx(self):
+        return self.con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='invidx'").fetchone()
+
+    def create_fulltext_index_py(self):
+        # one row per word, holding the compressed ids and positions of the logs containing it, see postings.py
+        self.con.execute('DROP TABLE IF EXISTS invidx')
+        writer = PostingsWriter(self.con, 'invidx', positions=True)
+        cur = self.con.execute("SELECT id, message FROM log WHERE message NOT IN ('BEG', 'END') ORDER BY id")
+        while True:
+            rows = cur.fetchmany(4096)
+            if not rows:
+                break
+            produced = 0
+            for (lid, _), tokens in zip(rows, tokenize_positions(message for _, message in rows)):
+                writer.add(lid, tokens)
+                produced += len(tokens)
+            profiling.count('tokens produced', produced)
+        writer.close()
+
+    def search_py_ids(self, q):
+        """
+        search q over the postings index. logs must contain every word, '"quoted phrases"' must appear
+        as is and `a NEAR/k b` needs at most k words between a and b (k defaults to 10).
+        words and phrases prefixed by '-' or 'NOT ' are excluded.
+        groups joined by OR are searched each and their ids merged, parentheses raise a ValueError.
+        phrases and NEAR are checked by merging the position lists of their words.
+        """
+        groups = split_or(q)
+        if len(groups) > 1:
+            return union([self._search_py_group(g) for g in groups])
+        return self._search_py_group(groups[0] if groups else '')
+
+    def _search_py_group(self, q):
+        words, excluded, phrases, excluded_phrases, nears = parse_query(q)
+        reader = PostingsReader(self.con, 'invidx')
+        ids = reader.all_of(words)
+        if excluded:
+            ids = difference(ids, reader.any_of(excluded))
+        if phrases or excluded_phrases or nears:
+            terms = set(t for operand in phrases + excluded_phrases for t, _ in operand)
+            for left, right, _ in nears:
+                terms.update(t for t, _ in left + right)
+            cursors = dict((t, PositionCursor(reader.positions(t))) for t in terms)
+            ids = self._filter_positions(ids, cursors, phrases, excluded_phrases, nears)
+        return ids
+
+    @staticmethod
+    def _filter_positions(ids, cursors, phrases, excluded_phrases, nears):
+        for lid in ids:
+            positions = dict((t, c.seek(lid)) for t, c in cursors.items())
+            if (all(phrase_starts(p, positions) for p in phrases) and
+                    not any(phrase_starts(p, positions) for p in excluded_phrases) and
+                    all(is_near(left, right, k, positions) for left, right, k in nears)):
+                yield lid
+
+    def get_logs(self, ids, block_size=512):
+        ids = iter(ids)
+        while True:
+            block = [i for _, i in zip(range(block_size), ids)]
+            if not block:
+                break
+            for row in self.con.execute('SELECT * FROM log WHERE id IN (%s) ORDER BY id' % ','.join(map(str, block))):
+                yield row
+
+    def search_py(self, q):
+        return self.get_logs(self.search_py_ids(q))
+
+    def is_hashidx(self):
+        return self.con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='hashidx'").fetchone()
+
+    def create_hash_index(self):
+        self.con.execute(SQL_CREATE_TABLE_HASH_INDEX)
+        cur = self.con.execute("SELECT id, message FROM log WHERE message NOT IN ('BEG', 'END')")
+        self.con.executemany(
+            'INSERT INTO hashidx (hash, id) VALUES (?, ?)',
+            ((h, lid) for lid, message in cur for h in extract_hashes(message))
+        )
+
+    def search_hash(self, prefix):
+        """
+        logs containing hashes or public keys starting with prefix, the prefix is a range scan on hashidx
+        """
+        prefix = prefix.lower()
+        if prefix.startswith('0x'):
+            prefix = prefix[2:]
+        return self.con.execute(
+            'SELECT * FROM log WHERE id IN (SELECT id FROM hashidx WHERE hash >= ? AND hash < ?)',
+            (prefix, prefix + 'g')  # 'g' sorts right after every hex digit
+        )
+
+    def first_hash(self, prefix):
+        """
+        (id, puttime, tid, function) of the first log containing a hash starting with prefix
+        """
+        prefix = prefix.lower()
+        if prefix.startswith('0x'):
+            prefix = prefix[2:]
+        return self.con.execute(
+            'SELECT id, puttime, tid, function FROM log WHERE id = '
+            '(SELECT min(id) FROM hashidx WHERE hash >= ? AND hash < ?)', (prefix, prefix + 'g')
+        ).fetchone()
+
+    def is_peer_index(self):
+        return self.con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='peer'").fetchone()
+
+    def create_peer_index(self):
+        self.con.execute(SQL_CREATE_TABLE_PEER)
+        self.con.execute(SQL_CREATE_TABLE_PEER_MINUTE)
+        cur = self.con.execute("SELECT id, puttime, message FROM log WHERE message NOT IN ('BEG', 'END')")
+
+        def peers():
+            for lid, puttime, message in cur:
+                addrs, length = extract_peers(message)
+                for addr in addrs:
+                    yield addr, lid, puttime[:16], length
+
+        self.con.executemany('INSERT INTO peer (addr, id, minute, len) VALUES (?, ?, ?, ?)', peers())
+        self.con.execute(
+            'INSERT INTO peer_minute (addr, minute, count, bytes) '
+            'SELECT addr, minute, count(*), ifnull(sum(len), 0) FROM peer GROUP BY addr, minute'
+        )
+
+    @staticmethod
+    def _addr_range(addr):
+        # a bare ip matches every port of it, ';' sorts right after ':'
+        if ':' in addr:
+            return addr, addr
+        return addr + ':', addr + ';'
+
+    def peer_logs(self, addr):
+        low, high = self._addr_range(addr)
+        return self.con.execute(
+            'SELECT * FROM log WHERE id IN (SELECT id FROM peer WHERE addr BETWEEN ? AND ?)', (low, high)
+        )
+
+    def peer_traffic(self, addr=None, start=None, end=None, per_minute=False):
+        """
+        (addr, minute, count, bytes) from the per-minute rollups, minute is None unless per_minute
+        """
+        where, args = ['1'], []
+        if addr:
+            where.append('addr BETWEEN ? AND ?')
+            args.extend(self._addr_range(addr))
+        if start:
+            where.append('minute >= ?')
+            args.append(start[:16])
+        if end:
+            where.append('minute <= ?')
+            args.append(end[:16])
+        if per_minute:
+            sql = 'SELECT addr, minute, count, bytes FROM peer_minute WHERE {w} ORDER BY addr, minute'
+        else:
+            sql = ('SELECT addr, NULL, sum(count), sum(bytes) FROM peer_minute WHERE {w} '
+                   'GROUP BY addr ORDER BY sum(bytes) DESC')
+        return self.con.execute(sql.format(w=' AND '.join(where)), args)
+
+    def is_rollup(self):
+        return self.con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='rollup'").fetchone()
+
+    def create_rollup_table(self):
+        self.con.execute(SQL_CREATE_TABLE_ROLLUP)
+
+    def put_rollup_many(self, counts):
+        self.con.executemany(
+            'INSERT INTO rollup (bucket, level, tid, function, count) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (bucket, level, tid, function) DO UPDATE SET count = count + excluded.count',
+            counts
+        )
+
+    def rollup_width(self):
+        row = self.con.execute('SELECT length(bucket) FROM rollup LIMIT 1').fetchone()
+        return row[0] if row else None
+
+    def histogram(self, width, by=None, start=None, end=None, level=None, tid=None, function=None):
+        """
+        (group, bucket, count) from the rollups re-bucketed to the puttime prefix of width,
+        group is None unless grouped by a field
+        """
+        where, args = ['1'], []
+        if start:
+            where.append('bucket >= ?')
+            args.append(start[:width])
+        if end:
+            where.append('substr(bucket, 1, ?) <= ?')
+            args.extend((width, end[:width]))
+        for field, value in (('level', level), ('tid', tid), ('function', function)):
+            if value is not None:
+                where.append('%s = ?' % field)
+                args.append(value)
+        group = by or 'NULL'
+        sql = ('SELECT {g}, substr(bucket, 1, {w}) AS b, sum(count) FROM rollup WHERE {where} '
+               'GROUP BY {g}, b ORDER BY {g}, b')
+        return self.con.execute(sql.format(g=group, w=int(width), where=' AND '.join(where)), args)
+
+    def is_latency_index(self):
+        return self.con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='latency'").fetchone()
+
+    def is_span_index(self):
+        return self.con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='span'").fetchone()
+
+    def create_span_index(self, max_pending=1 << 16):
+        """
+        the span table of the calls and the latency sketches, in one pass over the BEG/END logs
+        """
+        self.con.execute(SQL_CREATE_TABLE_SPAN)
+        self.con.execute(SQL_CREATE_TABLE_LATENCY)
+        sketches = {}
+        insert = 'INSERT INTO span (tid, depth, function, fileline, begin_id, end_id, begin, end, lvl, bin) ' \
+                 'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+
+        def row(tid, depth, function, fileline, begin_id, end_id, begin, end):
+            begin, end = int(round(begin * 1000)), int(round(end * 1000))
+            return (tid, depth, function, fileline, begin_id, end_id, begin, end) + span_bin(begin, end)
+
+        def flush():
+            # a window may be flushed more than once, its rows are merged when read
+            self.con.executemany(
+                'INSERT INTO latency (function, fileline, window, count, total, max, sketch) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                ((function, fileline, seconds_puttime(minute * 60)[:16], s.count, s.total, s.max,
+                  sqlite3.Binary(s.dumps())) for (function, fileline, minute), s in sketches.items())
+            )
+            sketches.clear()
+
+        def closed(spans):
+            for span in spans:
+                key = (span.function, span.fileline, int(span.begin // 60))
+                sketch = sketches.get(key)
+                if sketch is None:
+                    if len(sketches) >= max_pending:
+                        flush()
+                    sketch = sketches[key] = Sketch()
+                sketch.add(span.end - span.begin)
+                yield row(span.tid, span.depth, span.function, span.fileline, span.begin_id, span.end_id,
+                          span.begin, span.end)
+
+        builder = SpanBuilder()
+        self.con.executemany(insert, closed(iter_spans(self.con.execute(SQL_SELECT_CALLS), builder)))
+        flush()
+        last = self.con.execute('SELECT max(puttime) FROM log').fetchone()[0]
+        if last:
+            last = puttime_seconds(last)
+            self.con.executemany(insert, (row(tid, depth, function, fileline, lid, None, begin, max(begin, last))
+                                          for tid, depth, function, fileline, lid, begin in builder.open_calls()))
+        self.con.execute(SQL_CREATE_INDEX_SPAN_BIN)
+        self.con.execute(SQL_CREATE_INDEX_LATENCY)
+
+    def calls(self, start=None, end=None):
+        """
+        the BEG/END rows in id order as read by spans.py, optionally within a time range
+        """
+        where, args = [], []
+        if start:
+            where.append('puttime >= ?')
+            args.append(start)
+        if end:
+            where.append('puttime <= ?')
+            args.append(end)
+        return self.con.execute(SQL_SELECT_CALLS + ''.join(' AND ' + w for w in where) + ' ORDER BY id', args)
+
+    def _spans_between(self, columns, begin, end):
+        bins = range_bins(begin, end)
+        return self.con.execute(
+            'SELECT {c} FROM span WHERE ({bins}) AND begin <= ? AND end >= ? ORDER BY tid, depth'.format(
+                c=columns, bins=' OR '.join(['(lvl = ? AND bin BETWEEN ? AND ?)'] * len(bins))),
+            [v for b in bins for v in b] + [end, begin]
+        )
+
+    def active_spans(self, puttime):
+        """
+        the calls running at the puttime, by tid and depth
+        """
+        point = int(round(puttime_seconds(pad_puttime(puttime)) * 1000))
+        return self._spans_between('tid, depth, function, fileline, begin, end, end_id IS NULL', point, point)
+
+    def spans_between(self, start, end):
+        """
+        (tid, function, fileline, begin, end, open) of the calls overlapping the time range
+        """
+        return self._spans_between('tid, function, fileline, begin, end, end_id IS NULL',
+                                   int(round(puttime_seconds(pad_puttime(start)) * 1000)),
+                                   int(round(puttime_seconds(pad_puttime(end)) * 1000)))
+
+    def time_range(self, start=None, end=None):
+        """
+        the first and last puttime of the logs, within the range if given
+        """
+        return self.con.execute('SELECT min(puttime), max(puttime) FROM log WHERE puttime BETWEEN ? AND ?',
+                                (start or '', end or '~')).fetchone()
+
+    def messages(self, start=None, end=None):
+        """
+        messages of the logs in the whole rollup buckets of the time range, the range of rollup_counts
+        """
+        start, _, end = self._rollup_range_args(start, end)
+        # '~' sorts after every puttime having the bucket prefix
+        return self.con.execute('SELECT message FROM log WHERE puttime BETWEEN ? AND ?', (start, end + '~'))
+
+    def logs_between(self, start, end, levels):
+        return self.con.execute(
+            'SELECT * FROM log WHERE puttime BETWEEN ? AND ? AND level IN ({q}) ORDER BY id'.format(
+                q=','.join('?' * len(levels))), [start, end] + list(levels))
+
+    def latency(self, start=None, end=None, function=None):
+        """
+        (function, fileline, sketch blob) of the calls began in the time range
+        """
+        where, args = ['1'], []
+        if start:
+            where.append('window >= ?')
+            args.append(start[:16])
+        if end:
+            where.append('window <= ?')
+            args.append(end[:16])
+        if function:
+            where.append('function = ?')
+            args.append(function[:20])
+        return self.con.execute(
+            'SELECT function, fileline, sketch FROM latency WHERE {w}'.format(w=' AND '.join(where)), args)
+
+    def is_events(self):
+        return self.con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='events'").fetchone()
+
+    def create_events_table(self):
+        self.con.execute(SQL_CREATE_TABLE_EVENTS)
+
+    def put_events(self, events):
+        self.con.executemany('INSERT INTO events (kind, key, start, end, value, baseline) VALUES (?, ?, ?, ?, ?, ?)',
+                             events)
+
+    def events(self, kind=None, start=None, end=None):
+        where, args = ['1'], []
+        if kind:
+            where.append('kind = ?')
+            args.append(kind)
+        if start:
+            where.append('end >= ?')
+            args.append(start)
+        if end:
+            where.append('start <= ?')
+            args.append(end)
+        return self.con.execute(
+            'SELECT kind, key, start, end, value, baseline FROM events WHERE {w} ORDER BY start'.format(
+                w=' AND '.join(where)), args)
+
+    def rollup_counts(self, field, start=None, end=None):
+        """
+        (value, count) of the field ('level', 'tid' or 'function') from the rollups of the time range
+        """
+        return self.con.execute(
+            'SELECT {f}, sum(count) FROM rollup WHERE {w} GROUP BY {f}'.format(f=field, w=self._rollup_range()),
+            self._rollup_range_args(start, end))
+
+    def rollup_buckets(self, start=None, end=None):
+        """
+        the first and last bucket of the rollups of the time range
+        """
+        return self.con.execute('SELECT min(bucket), max(bucket) FROM rollup WHERE ' + self._rollup_range(),
+                                self._rollup_range_args(start, end)).fetchone()
+
+    @staticmethod
+    def _rollup_range():
+        return 'bucket >= ? AND substr(bucket, 1, ?) <= ?'
+
+    def _rollup_range_args(self, start, end):
+        width = self.rollup_width() or 0
+        return (start or '')[:width], width, (end or '~')[:width]
+
+    def is_kv_index(self):
+        return self.con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='kv'").fetchone()
+
+    def create_kv_index(self):
+        self.con.execute(SQL_CREATE_TABLE_KV)
+        cur = self.con.execute("SELECT id, message FROM log WHERE message NOT IN ('BEG', 'END')")
+        self.con.executemany(
+            'INSERT INTO kv (key, value, id) VALUES (?, ?, ?)',
+            ((k, v, lid) for lid, message in cur for k, v in extract_kv(message))
+        )
+        self.con.execute(SQL_CREATE_INDEX_KV)
+
+    def kv_keys(self):
+        return self.con.execute('SELECT key, count(*), min(value), max(value) FROM kv GROUP BY key')
+
+    def search_kv(self, key, low=None, high=None):
+        where, args = ['key = ?'], [key]
+        if low is not None:
+            where.append('value >= ?')
+            args.append(low)
+        if high is not None:
+            where.append('value <= ?')
+            args.append(high)
+        return self.con.execute(
+            'SELECT * FROM log WHERE id IN (SELECT id FROM kv WHERE %s)' % ' AND '.join(where), args
+        )
+
+    def first_kv(self, key, value):
+        """
+        (id, puttime, tid, function) of the first log where key = value
+        """
+        return self.con.execute(
+            'SELECT id, puttime, tid, function FROM log WHERE id = (SELECT min(id) FROM kv WHERE key = ? AND value = ?)',
+            (key, value)
+        ).fetchone()
+
+    def first_kv_values(self, key, start=None, end=None):
+        """
+        (value, id, puttime, tid, function) of the first log of every value of the key, first seen in the time range
+        """
+        where, args = ['1'], [key]
+        if start:
+            where.append('l.puttime >= ?')
+            args.append(start)
+        if end:
+            where.append('l.puttime <= ?')
+            args.append(end)
+        return self.con.execute(
+            'SELECT k.value, l.id, l.puttime, l.tid, l.function '
+            'FROM (SELECT value, min(id) AS id FROM kv WHERE key = ? GROUP BY value) k JOIN log l ON l.id = k.id '
+            'WHERE {w}'.format(w=' AND '.join(where)), args
+        )
 
     @contextmanager
     def transaction_context(self):
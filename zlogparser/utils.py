@@ -2,12 +2,16 @@
 from __future__ import print_function
 
 import datetime
+import logging
 import sys
 import time
 from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
 from functools import wraps
 from threading import Thread, Lock
 
+import profiling
+
 if sys.version_info[0] < 3:
     PY2 = True
     PY3 = False
@@ -15,6 +19,16 @@ else:
     PY2 = False
     PY3 = True
 
+@contextmanager
+def measure_time(name):
+    t = time.time()
+    cpu = profiling.cpu_time() if profiling.enabled else 0
+    yield
+    if profiling.enabled:
+        profiling.record_stage(name, time.time() - t, profiling.cpu_time() - cpu)
+    logging.getLogger().info("%s done. Cost: %.1f sec" % (name, time.time() - t))
+
+
 _CacheInfo = namedtuple("CacheInfo", "hits misses maxsize currsize")
 
 
@@ -199,24 +213,29 @@ def shorten_time(t):
     return parse_puttime(t).strftime('%H:%M:%S.%f').rstrip('0')
 
 
-def levenshtein(seq1, seq2, limit=None):
+def levenshtein(seq1, seq2, limit=None, transpositions=False):
     """
     the Levenshtein edit distance between two strings.
+    with transpositions, swapping two adjacent characters counts as one edit (optimal string alignment).
     """
-    # oneago = None
+    oneago = None
     thisrow = list(range(1, len(seq2) + 1)) + [0]
     for x in range(len(seq1)):
         # Python lists wrap around for negative indices, so put the
         # leftmost column at the *end* of the list. This matches with
         # the zero-indexed strings and saves extra calculation.
-        oneago, thisrow = thisrow, [0] * len(seq2) + [x + 1]
+        twoago, oneago, thisrow = oneago, thisrow, [0] * len(seq2) + [x + 1]
         for y in range(len(seq2)):
             delcost = oneago[y] + 1
             addcost = thisrow[y - 1] + 1
             subcost = oneago[y - 1] + (seq1[x] != seq2[y])
             thisrow[y] = min(delcost, addcost, subcost)
+            if (transpositions and x > 0 and y > 0 and seq1[x] == seq2[y - 1] and
+                    seq1[x - 1] == seq2[y] and seq1[x] != seq2[y]):
+                thisrow[y] = min(thisrow[y], twoago[y - 2] + 1)
 
-        if limit and x > limit and min(thisrow) > limit:
+        # a transposition may come back from the row before
+        if limit and x > limit and min(thisrow) > limit and not (transpositions and min(oneago) <= limit):
             return limit + 1
 
     return thisrow[len(seq2) - 1]